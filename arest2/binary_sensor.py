@@ -13,18 +13,32 @@ from homeassistant.components.binary_sensor import (
     PLATFORM_SCHEMA,
     BinarySensorEntity,
 )
-from homeassistant.const import CONF_DEVICE_CLASS, CONF_NAME, CONF_PIN, CONF_RESOURCE
+from homeassistant.const import (
+    CONF_DEVICE_CLASS,
+    CONF_NAME,
+    CONF_PIN,
+    CONF_RESOURCE,
+    CONF_SCAN_INTERVAL,
+)
 from homeassistant.core import HomeAssistant
 import homeassistant.helpers.config_validation as cv
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
 from homeassistant.helpers.typing import ConfigType, DiscoveryInfoType
-from homeassistant.util import Throttle
+
+from .coordinator import get_board
+from .entity import ArestEntity
+from .scheduler import Schedule
+from .transport import TRANSPORT_SCHEMA, get_transport
 
 _LOGGER = logging.getLogger(__name__)
 
 CONF_VARIABLE = "variable"
+CONF_MAX_INTERVAL = "max_interval"
 
-MIN_TIME_BETWEEN_UPDATES = timedelta(seconds=30)
+# Floor of the adaptive polling interval, scan_interval overrides it
+SCAN_INTERVAL = timedelta(seconds=5)
+# Ceiling of the adaptive polling interval while the state doesn't change
+DEFAULT_MAX_INTERVAL = timedelta(seconds=60)
 
 PLATFORM_SCHEMA = PLATFORM_SCHEMA.extend(
     {
@@ -33,6 +47,8 @@ PLATFORM_SCHEMA = PLATFORM_SCHEMA.extend(
         vol.Optional(CONF_PIN): cv.string,
         vol.Optional(CONF_VARIABLE): cv.string,
         vol.Optional(CONF_DEVICE_CLASS): DEVICE_CLASSES_SCHEMA,
+        vol.Optional(CONF_MAX_INTERVAL, default=DEFAULT_MAX_INTERVAL): cv.positive_time_period,
+        **TRANSPORT_SCHEMA,
     }
 )
 
@@ -46,10 +62,14 @@ def setup_platform(
     """Set up the aREST binary sensor."""
     resource = config[CONF_RESOURCE]
     device_class = config.get(CONF_DEVICE_CLASS)
+    floor = config.get(CONF_SCAN_INTERVAL, SCAN_INTERVAL).total_seconds()
+    ceiling = config[CONF_MAX_INTERVAL].total_seconds()
+    # Entities share the board transport and coordinator, configured here
+    get_transport(resource, config)
     isAvailable = True
 
     try:
-        response = requests.get(resource, timeout=10).json()
+        get_board(resource).refresh(force=True)
     except requests.exceptions.MissingSchema:
         _LOGGER.error(
             "Missing resource or schema in configuration. Add http:// to your URL"
@@ -69,6 +89,7 @@ def setup_platform(
                         config.get(CONF_NAME),
                         pin,
                         isAvailable,
+                        Schedule(floor, ceiling),
                     )
                 ],
                 True,
@@ -84,16 +105,17 @@ def setup_platform(
                         config.get(CONF_NAME),
                         variable,
                         isAvailable,
+                        Schedule(floor, ceiling),
                     )
                 ],
                 True,
             )
 
 
-class ArestBinarySensorPin(BinarySensorEntity):
+class ArestBinarySensorPin(ArestEntity, BinarySensorEntity):
     """Implement an aREST binary sensor for a pin."""
 
-    def __init__(self, resource, name, pin, available):
+    def __init__(self, resource, name, pin, available, schedule=None):
 
         if pin is None:
             _LOGGER.error("You must set the pin number for %s", resource)
@@ -105,6 +127,11 @@ class ArestBinarySensorPin(BinarySensorEntity):
         self._attr_name = name
         self._attr_is_on = False
         self._attr_available = available
+        self._transport = get_transport(resource)
+        self._board = get_board(resource)
+        self._schedule = schedule or Schedule(
+            SCAN_INTERVAL.total_seconds(), DEFAULT_MAX_INTERVAL.total_seconds()
+        )
 
         if available is True:
             try:
@@ -114,19 +141,23 @@ class ArestBinarySensorPin(BinarySensorEntity):
                 self._attr_available = False
             
 
-    @Throttle(MIN_TIME_BETWEEN_UPDATES)
     def update(self) -> None:
-        """Get the latest data from aREST API."""
+        """Get the latest data from aREST API when the schedule is due."""
+        if not self._schedule.due():
+            self._polled = False
+            return
         try:
-            response = requests.get(f"{self._resource}/digital/{self._pin}", timeout=10)
-            self._attr_is_on = bool(response.json()["return_value"])
+            is_on = bool(self._board.pin(self._pin))
+            self._schedule.record(is_on != self._attr_is_on)
+            self._attr_is_on = is_on
             if self._attr_available is False:
                 self.__set_pin_input()
         except requests.exceptions.ConnectionError:
             _LOGGER.error("No route to device '%s'", self._resource)
+            self._schedule.failed()
     
     def __set_pin_input(self) -> None:
-        request = requests.get(f"{self._resource}/mode/{self._pin}/i", timeout=10)
+        request = self._transport.get(f"{self._resource}/mode/{self._pin}/i")
         if request.status_code != HTTPStatus.OK:
             _LOGGER.error("Can't set mode")
             self._attr_available = False
@@ -134,10 +165,10 @@ class ArestBinarySensorPin(BinarySensorEntity):
             self._attr_available = True
 
 
-class ArestBinarySensorVariable(BinarySensorEntity):
+class ArestBinarySensorVariable(ArestEntity, BinarySensorEntity):
     """Implement an aREST binary sensor for a variable."""
 
-    def __init__(self, resource, name, variable, available):
+    def __init__(self, resource, name, variable, available, schedule=None):
         if variable is None:
             _LOGGER.error("You must set the variable for %s", resource)
             raise KeyError("You must set the variable name")
@@ -148,27 +179,32 @@ class ArestBinarySensorVariable(BinarySensorEntity):
         self._attr_name = name
         self._attr_is_on = False
         self._attr_available = available
+        self._board = get_board(resource)
+        self._schedule = schedule or Schedule(
+            SCAN_INTERVAL.total_seconds(), DEFAULT_MAX_INTERVAL.total_seconds()
+        )
 
         if available is True:
             self.__check_variable()
 
 
-    @Throttle(MIN_TIME_BETWEEN_UPDATES)
     def update(self) -> None:
-        """Get the latest data from aREST API."""
+        """Get the latest data from aREST API when the schedule is due."""
+        if not self._schedule.due():
+            self._polled = False
+            return
         try:
-            response = requests.get(f"{self._resource}/{self._variable}", timeout=10)
-            self._attr_is_on = bool(response.json()[self._variable])
+            is_on = bool(self._board.variable(self._variable))
+            self._schedule.record(is_on != self._attr_is_on)
+            self._attr_is_on = is_on
             if self._attr_available is False:
                 self._attr_available = True
         except requests.exceptions.ConnectionError:
             _LOGGER.error("No route to device '%s'", self._resource)
             self._attr_available = False
+            self._schedule.failed()
 
     def __check_variable(self) -> None:
-        request = requests.get(f"{self._resource}/{self._variable}", timeout=10)
-        if request.status_code != HTTPStatus.OK:
-            _LOGGER.error("Problem appear when get variable %s", self._resource)
-        if request.json()[self._variable] is None:
+        if self._board.variable(self._variable) is None:
             _LOGGER.error("Variable not found %s", self._resource)
 
@@ -0,0 +1,115 @@
+"""Fail fast on the aREST boards known to be unreachable."""
+from __future__ import annotations
+
+import logging
+from threading import Lock
+import time
+from urllib.parse import urlsplit
+
+import requests
+
+_LOGGER = logging.getLogger(__name__)
+
+# Connection failures in a row before a board is considered down
+FAILURE_THRESHOLD = 3
+# Seconds before a request probes a board considered down
+RESET_TIMEOUT = 30
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+_breakers: dict[str, CircuitBreaker] = {}
+_lock = Lock()
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """Request not sent because its board is considered down."""
+
+
+def get_breaker(url: str) -> CircuitBreaker:
+    """Return the breaker of the host of an URL, shared by all its entities."""
+    host = urlsplit(url).netloc
+    with _lock:
+        if host not in _breakers:
+            _breakers[host] = CircuitBreaker(host)
+        return _breakers[host]
+
+
+def unreachable(error: BaseException) -> bool:
+    """Return True if an error means the board didn't answer."""
+    return isinstance(
+        error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)
+    ) and not isinstance(error, CircuitOpenError)
+
+
+class CircuitBreaker:
+    """
+    Connection state of one board, shared by all its entities.
+
+    Closed, requests are sent. After FAILURE_THRESHOLD connection failures in
+    a row the breaker opens and requests fail right away with
+    CircuitOpenError. After RESET_TIMEOUT seconds it is half-open: a single
+    request probes the board while the others keep failing fast. The probe
+    closes the breaker if the board answers, or opens it for another
+    RESET_TIMEOUT.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        failure_threshold: int = FAILURE_THRESHOLD,
+        reset_timeout: float = RESET_TIMEOUT,
+    ) -> None:
+        self._host = host
+        self._failure_threshold = failure_threshold
+        self._reset_timeout = reset_timeout
+        self._lock = Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+
+    @property
+    def state(self) -> str:
+        return self._state
+
+    def allow(self) -> None:
+        """Raise CircuitOpenError unless a request can be sent now."""
+        with self._lock:
+            if self._state == CLOSED:
+                return
+            if self._state == OPEN:
+                elapsed = time.monotonic() - self._opened_at
+                if elapsed >= self._reset_timeout:
+                    # This request is the probe
+                    self._state = HALF_OPEN
+                    return
+                raise CircuitOpenError(
+                    f"{self._host} is unreachable, next probe in "
+                    f"{self._reset_timeout - elapsed:.0f} s"
+                )
+            raise CircuitOpenError(f"{self._host} is unreachable, probe in progress")
+
+    def record(self, error: BaseException | None = None) -> None:
+        """Account the outcome of a request allowed by allow()."""
+        with self._lock:
+            if error is None or not unreachable(error):
+                if self._state != CLOSED:
+                    _LOGGER.info("%s is reachable again", self._host)
+                self._state = CLOSED
+                self._failures = 0
+                return
+
+            self._failures += 1
+            if self._state == HALF_OPEN or (
+                self._state == CLOSED and self._failures >= self._failure_threshold
+            ):
+                if self._state == CLOSED:
+                    _LOGGER.warning(
+                        "%s is unreachable, fail fast for %d s: %s",
+                        self._host,
+                        self._reset_timeout,
+                        error,
+                    )
+                self._state = OPEN
+                self._opened_at = time.monotonic()
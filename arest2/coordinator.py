@@ -0,0 +1,102 @@
+"""Share the reads of an aREST board between all its entities."""
+from __future__ import annotations
+
+import logging
+from threading import Lock
+import time
+from typing import Any, Callable
+
+import requests
+
+from .transport import Transport, get_transport
+
+_LOGGER = logging.getLogger(__name__)
+
+# Seconds a value read is shared by the entities of a board
+CYCLE = 1.0
+
+_boards: dict[str, BoardCoordinator] = {}
+_lock = Lock()
+
+
+def get_board(resource: str) -> BoardCoordinator:
+    """
+    Return the coordinator of the board of a resource, create it on first use.
+
+    Boards behind one host, e.g. http://gw/board1 and http://gw/board2, have
+    their own coordinator and share the transport of the host.
+    """
+    with _lock:
+        if resource not in _boards:
+            _boards[resource] = BoardCoordinator(resource, get_transport(resource))
+        return _boards[resource]
+
+
+class BoardCoordinator:
+    """
+    Share the reads of one board between all its entities.
+
+    Each read GETs only what an entity asks for: the root resource, whose
+    variables object holds every variable, or one digital pin. Its result
+    is shared for CYCLE seconds, so the variable sensors of a board updated
+    together send one root GET, and reading a variable never reads a pin.
+    Variables missing from the root resource are read on their own.
+    """
+
+    def __init__(self, resource: str, transport: Transport, cycle: float = CYCLE) -> None:
+        self._resource = resource
+        self._transport = transport
+        self._cycle = cycle
+        self._lock = Lock()
+        # (read at, value, error) by path relative to the resource
+        self._reads: dict[str, tuple[float, Any, Exception | None]] = {}
+
+    def refresh(self, force: bool = False) -> None:
+        """Read the root resource unless read in the last CYCLE seconds, raise its error."""
+        self._read("", _variables, force)
+
+    def invalidate(self, pin: str | None = None) -> None:
+        """Read a pin, or everything, again on the next read, e.g. after writing it."""
+        with self._lock:
+            if pin is None:
+                self._reads.clear()
+            else:
+                self._reads.pop(f"digital/{pin}", None)
+
+    def variable(self, name: str) -> Any:
+        """Return the value of a variable, from the root resource if it has it."""
+        variables = self._read("", _variables)
+        if name in variables:
+            return variables[name]
+        _LOGGER.debug("Variable %s not in the root resource of %s", name, self._resource)
+        return self._read(name, lambda document: document[name])
+
+    def pin(self, pin: str) -> Any:
+        """Return the value of a digital pin."""
+        return self._read(f"digital/{pin}", _return_value)
+
+    def _read(self, path: str, extract: Callable[[Any], Any], force: bool = False) -> Any:
+        with self._lock:
+            now = time.monotonic()
+            read = self._reads.get(path)
+            if not force and read is not None and now - read[0] < self._cycle:
+                _, value, error = read
+                if error is not None:
+                    raise error
+                return value
+            url = f"{self._resource}/{path}" if path else self._resource
+            try:
+                value = extract(self._transport.get(url).json())
+            except (requests.exceptions.RequestException, ValueError) as error:
+                self._reads[path] = (now, None, error)
+                raise
+            self._reads[path] = (now, value, None)
+            return value
+
+
+def _variables(document: dict[str, Any]) -> dict[str, Any]:
+    return document.get("variables") or {}
+
+
+def _return_value(document: dict[str, Any]) -> Any:
+    return document["return_value"]
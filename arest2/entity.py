@@ -0,0 +1,88 @@
+"""Base entity of the aREST platforms."""
+from __future__ import annotations
+
+from datetime import datetime, timedelta
+import logging
+from typing import Any
+
+from homeassistant.core import callback
+from homeassistant.helpers.entity import Entity
+from homeassistant.helpers.event import async_track_time_interval
+
+_LOGGER = logging.getLogger(__name__)
+
+ATTR_SKIPPED_WRITES = "skipped_writes"
+
+# Unchanged states are written at least this often, for liveness
+HEARTBEAT_INTERVAL = timedelta(minutes=5)
+
+
+class ArestEntity(Entity):
+    """
+    Polled aREST entity writing its state only when it changed.
+
+    After each update the state is written only if it or the availability
+    changed, and every HEARTBEAT_INTERVAL when nothing was written meanwhile.
+    The writes skipped are counted in the skipped_writes attribute, not
+    recorded. An update that read nothing, because the schedule of the
+    entity wasn't due, writes nothing and isn't counted.
+    """
+
+    _written: tuple[bool, Any] | None = None
+    _wrote = False
+    _heartbeat = False
+    _skipped_writes = 0
+    # False after an update that didn't read the board
+    _polled = True
+    _unrecorded_attributes = frozenset({ATTR_SKIPPED_WRITES})
+
+    @property
+    def force_update(self) -> bool:
+        """Heartbeats write the state even if it didn't change."""
+        return self._heartbeat
+
+    @property
+    def extra_state_attributes(self) -> dict[str, Any]:
+        """Return the number of state writes skipped."""
+        return {ATTR_SKIPPED_WRITES: self._skipped_writes}
+
+    async def async_added_to_hass(self) -> None:
+        """Start the heartbeat."""
+        self.async_on_remove(
+            async_track_time_interval(self.hass, self._async_heartbeat, HEARTBEAT_INTERVAL)
+        )
+
+    async def async_update_ha_state(self, force_refresh: bool = False) -> None:
+        """Update the entity if asked, then write its state only if it changed."""
+        if force_refresh:
+            self._polled = True
+            try:
+                await self.async_device_update()
+            except Exception:  # pylint: disable=broad-except
+                _LOGGER.exception("Update for %s fails", self.entity_id)
+                return
+            if not self._polled:
+                return
+        self._async_write_changed()
+
+    @callback
+    def _async_write_changed(self) -> None:
+        written = (self.available, self.state)
+        if written == self._written:
+            self._skipped_writes += 1
+            return
+        self._written = written
+        self._wrote = True
+        self.async_write_ha_state()
+
+    @callback
+    def _async_heartbeat(self, _now: datetime) -> None:
+        if self._wrote:
+            self._wrote = False
+            return
+        self._heartbeat = True
+        try:
+            self.async_write_ha_state()
+        finally:
+            self._heartbeat = False
+        self._written = (self.available, self.state)
@@ -0,0 +1,51 @@
+"""Adaptive polling interval of the aREST entities."""
+from __future__ import annotations
+
+import time
+
+# Factor stretching the interval after each poll without change
+STRETCH_FACTOR = 1.5
+# Factor stretching the interval after each failed poll
+FAILURE_FACTOR = 2
+# Longest interval while a device is unreachable, in seconds
+MAX_FAILURE_INTERVAL = 300
+
+
+class Schedule:
+    """
+    Polling interval of one entity, kept between a floor and a ceiling.
+
+    A change brings the interval back to the floor, each poll without change
+    stretches it towards the ceiling. Failures back off exponentially up to
+    MAX_FAILURE_INTERVAL (or the ceiling if higher), the first success polls
+    at the floor again. Intervals are in seconds.
+    """
+
+    def __init__(self, floor: float, ceiling: float) -> None:
+        self.floor = floor
+        self.ceiling = max(floor, ceiling)
+        self.interval = floor
+        self.failures = 0
+        # A new entity is due right away
+        self.next_due = 0.0
+
+    def due(self) -> bool:
+        return time.monotonic() >= self.next_due
+
+    def record(self, changed: bool) -> None:
+        """Account a successful poll, changed if the state differs."""
+        if changed or self.failures:
+            self.interval = self.floor
+        else:
+            self.interval = min(self.interval * STRETCH_FACTOR, self.ceiling)
+        self.failures = 0
+        self.next_due = time.monotonic() + self.interval
+
+    def failed(self) -> None:
+        """Account a failed poll."""
+        self.failures += 1
+        self.interval = min(
+            max(self.interval, self.floor) * FAILURE_FACTOR,
+            max(MAX_FAILURE_INTERVAL, self.ceiling),
+        )
+        self.next_due = time.monotonic() + self.interval
@@ -15,6 +15,10 @@ import homeassistant.helpers.config_validation as cv
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
 from homeassistant.helpers.typing import ConfigType, DiscoveryInfoType
 
+from .coordinator import get_board
+from .entity import ArestEntity
+from .transport import TRANSPORT_SCHEMA, get_transport
+
 _LOGGER = logging.getLogger(__name__)
 
 CONF_FUNCTIONS = "functions"
@@ -41,6 +45,7 @@ PLATFORM_SCHEMA = PLATFORM_SCHEMA.extend(
         vol.Optional(CONF_FUNCTIONS, default={}): vol.Schema(
             {cv.string: PIN_FUNCTION_SCHEMA}
         ),
+        **TRANSPORT_SCHEMA,
     }
 )
 
@@ -53,10 +58,12 @@ def setup_platform(
 ) -> None:
     """Set up the aREST switches."""
     resource = config[CONF_RESOURCE]
+    # Entities share the board transport and coordinator, configured here
+    get_transport(resource, config)
     isAvailable = True
 
     try:
-        response = requests.get(resource, timeout=10)
+        get_board(resource).refresh(force=True)
     except requests.exceptions.MissingSchema:
         _LOGGER.error(
             "Missing resource or schema in configuration. Add http:// to your URL"
@@ -97,7 +104,7 @@ def setup_platform(
     add_entities(dev)
 
 
-class ArestSwitchBase(SwitchEntity):
+class ArestSwitchBase(ArestEntity, SwitchEntity):
     """Representation of an aREST switch."""
 
     def __init__(self, resource, location, name, ensure, available):
@@ -108,6 +115,8 @@ class ArestSwitchBase(SwitchEntity):
         self._attr_available = available
         self._attr_is_on = False
         self._ensure = ensure
+        self._transport = get_transport(resource)
+        self._board = get_board(resource)
 
 
 class ArestSwitchFunction(ArestSwitchBase):
@@ -127,8 +136,8 @@ class ArestSwitchFunction(ArestSwitchBase):
 
     def turn_on(self, **kwargs: Any) -> None:
         """Turn the device on."""
-        request = requests.get(
-            f"{self._resource}/{self._func}", timeout=10, params={"params": "1"}
+        request = self._transport.get(
+            f"{self._resource}/{self._func}", idempotent=False, params={"params": "1"}
         )
 
         if request.status_code == HTTPStatus.OK:
@@ -138,8 +147,8 @@ class ArestSwitchFunction(ArestSwitchBase):
 
     def turn_off(self, **kwargs: Any) -> None:
         """Turn the device off."""
-        request = requests.get(
-            f"{self._resource}/{self._func}", timeout=10, params={"params": "0"}
+        request = self._transport.get(
+            f"{self._resource}/{self._func}", idempotent=False, params={"params": "0"}
         )
 
         if request.status_code == HTTPStatus.OK:
@@ -153,7 +162,7 @@ class ArestSwitchFunction(ArestSwitchBase):
     def update(self) -> None:
         """Get the latest data from aREST API and update the state."""
         try:
-            request = requests.get(f"{self._resource}/{self._func}", timeout=10)
+            request = self._transport.get(f"{self._resource}/{self._func}", idempotent=False)
             current_state = request.json()["return_value"]
             if self._ensure is True:
                 if self._attr_is_on != current_state:
@@ -174,7 +183,7 @@ class ArestSwitchFunction(ArestSwitchBase):
             self._attr_available = False
     
     def __check_function(self) -> None:
-        request = requests.get(f"{self._resource}/{self._func}", timeout=10)
+        request = self._transport.get(f"{self._resource}/{self._func}", idempotent=False)
 
         if request.status_code != HTTPStatus.OK:
             _LOGGER.error("Can't find function")
@@ -207,9 +216,10 @@ class ArestSwitchPin(ArestSwitchBase):
     def turn_on(self, **kwargs: Any) -> None:
         """Turn the device on."""
         turn_on_payload = int(not self._invert)
-        request = requests.get(
-            f"{self._resource}/digital/{self._pin}/{turn_on_payload}", timeout=10
+        request = self._transport.get(
+            f"{self._resource}/digital/{self._pin}/{turn_on_payload}"
         )
+        self._board.invalidate(self._pin)
         if request.status_code == HTTPStatus.OK:
             self._attr_is_on = True
         else:
@@ -218,9 +228,10 @@ class ArestSwitchPin(ArestSwitchBase):
     def turn_off(self, **kwargs: Any) -> None:
         """Turn the device off."""
         turn_off_payload = int(self._invert)
-        request = requests.get(
-            f"{self._resource}/digital/{self._pin}/{turn_off_payload}", timeout=10
+        request = self._transport.get(
+            f"{self._resource}/digital/{self._pin}/{turn_off_payload}"
         )
+        self._board.invalidate(self._pin)
         if request.status_code == HTTPStatus.OK:
             self._attr_is_on = False
         else:
@@ -229,9 +240,8 @@ class ArestSwitchPin(ArestSwitchBase):
     def update(self) -> None:
         """Get the latest data from aREST API and update the state."""
         try:
-            request = requests.get(f"{self._resource}/digital/{self._pin}", timeout=10)
             status_value = int(self._invert)
-            current_state = request.json()["return_value"] != status_value
+            current_state = self._board.pin(self._pin) != status_value
             if self._attr_available is False:
                 self.__set_pin_output()
             if self._ensure is True:
@@ -249,7 +259,7 @@ class ArestSwitchPin(ArestSwitchBase):
             self._attr_available = False
 
     def __set_pin_output(self) -> None:
-        request = requests.get(f"{self._resource}/mode/{self._pin}/o", timeout=10)
+        request = self._transport.get(f"{self._resource}/mode/{self._pin}/o")
         if request.status_code != HTTPStatus.OK:
             _LOGGER.error("Can't set mode")
             self._attr_available = False
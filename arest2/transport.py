@@ -0,0 +1,139 @@
+"""Timeouts, retries and circuit breaker of the requests sent to an aREST board."""
+from __future__ import annotations
+
+from collections import deque
+import logging
+import random
+from threading import Lock
+import time
+from typing import Any
+from urllib.parse import urlsplit
+
+import requests
+import voluptuous as vol
+
+from homeassistant.const import CONF_TIMEOUT
+import homeassistant.helpers.config_validation as cv
+
+from .breaker import get_breaker, unreachable
+
+_LOGGER = logging.getLogger(__name__)
+
+CONF_RETRIES = "retries"
+CONF_MIN_TIMEOUT = "min_timeout"
+
+# Retries of a failed idempotent request, 0 to disable
+DEFAULT_RETRIES = 2
+# Seconds of the timeouts until enough latencies are known, and their ceiling
+DEFAULT_TIMEOUT = 10
+# Floor of the adaptive timeouts, in seconds
+MIN_TIMEOUT = 1
+# Timeouts are this factor of the observed latency percentiles
+TIMEOUT_FACTOR = 4
+# Latencies kept per board, and needed before the timeouts adapt
+MAX_SAMPLES = 100
+MIN_SAMPLES = 20
+# Seconds of the first retry delay, doubled on each retry, and their ceiling
+BACKOFF = 0.5
+MAX_BACKOFF = 5
+
+# Statuses of an overloaded or restarting board, worth retrying
+RETRY_STATUSES = (502, 503, 504)
+
+# Options shared by the aREST platforms to tune the requests of a board
+TRANSPORT_SCHEMA = {
+    vol.Optional(CONF_RETRIES, default=DEFAULT_RETRIES): vol.All(
+        vol.Coerce(int), vol.Range(min=0, max=10)
+    ),
+    vol.Optional(CONF_TIMEOUT, default=DEFAULT_TIMEOUT): cv.positive_float,
+    vol.Optional(CONF_MIN_TIMEOUT, default=MIN_TIMEOUT): cv.positive_float,
+}
+
+_transports: dict[str, Transport] = {}
+_lock = Lock()
+
+
+def get_transport(resource: str, config: dict[str, Any] | None = None) -> Transport:
+    """
+    Return the transport of the board of a resource, create it on first use.
+
+    Entities of a board share its transport, configured by the first
+    platform set up.
+    """
+    host = urlsplit(resource).netloc
+    with _lock:
+        if host not in _transports:
+            config = config or {}
+            _transports[host] = Transport(
+                resource,
+                config.get(CONF_RETRIES, DEFAULT_RETRIES),
+                config.get(CONF_TIMEOUT, DEFAULT_TIMEOUT),
+                config.get(CONF_MIN_TIMEOUT, MIN_TIMEOUT),
+            )
+        return _transports[host]
+
+
+class Transport:
+    """
+    Send the requests of one board.
+
+    The connect timeout follows the median latency of the board, the read
+    timeout its 99th percentile, both times TIMEOUT_FACTOR and kept between
+    min_timeout and timeout. Idempotent requests are retried on connection
+    errors, timeouts and RETRY_STATUSES, after an exponential delay with full
+    jitter. Every attempt goes through the circuit breaker of the board.
+    """
+
+    def __init__(
+        self,
+        resource: str,
+        retries: int = DEFAULT_RETRIES,
+        timeout: float = DEFAULT_TIMEOUT,
+        min_timeout: float = MIN_TIMEOUT,
+    ) -> None:
+        self._breaker = get_breaker(resource)
+        self._retries = retries
+        self._timeout = timeout
+        self._min_timeout = min(min_timeout, timeout)
+        self._latencies: deque[float] = deque(maxlen=MAX_SAMPLES)
+        self._lock = Lock()
+
+    def get(self, url: str, idempotent: bool = True, **kwargs: Any) -> requests.Response:
+        """Send a GET request, retried unless it runs a function of the board."""
+        attempt = 0
+        while True:
+            self._breaker.allow()
+            start = time.perf_counter()
+            try:
+                response = requests.get(url, timeout=self.timeouts(), **kwargs)
+            except BaseException as error:
+                self._breaker.record(error)
+                if not (idempotent and attempt < self._retries and unreachable(error)):
+                    raise
+            else:
+                self._breaker.record()
+                with self._lock:
+                    self._latencies.append(time.perf_counter() - start)
+                if not (
+                    idempotent
+                    and attempt < self._retries
+                    and response.status_code in RETRY_STATUSES
+                ):
+                    return response
+            _LOGGER.debug("Retry %s", url)
+            time.sleep(random.uniform(0, min(MAX_BACKOFF, BACKOFF * 2**attempt)))
+            attempt += 1
+
+    def timeouts(self) -> tuple[float, float]:
+        """Return the (connect, read) timeouts in seconds."""
+        with self._lock:
+            if len(self._latencies) < MIN_SAMPLES:
+                return self._timeout, self._timeout
+            latencies = sorted(self._latencies)
+        return (
+            self._bound(latencies[len(latencies) // 2]),
+            self._bound(latencies[min(len(latencies) - 1, len(latencies) * 99 // 100)]),
+        )
+
+    def _bound(self, latency: float) -> float:
+        return min(max(latency * TIMEOUT_FACTOR, self._min_timeout), self._timeout)
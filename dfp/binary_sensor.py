@@ -1,6 +1,4 @@
 import logging
-import requests
-from datetime import timedelta
 
 import voluptuous as vol
 
@@ -16,23 +14,27 @@ from homeassistant.const import (
     CONF_RESOURCE_TEMPLATE,
     CONF_VALUE_TEMPLATE
 )
-from homeassistant.exceptions import TemplateError
 import homeassistant.helpers.config_validation as cv
-from homeassistant.helpers.entity import Entity
-from homeassistant.util import Throttle
 
-from .client import Client
+from .coordinator import HISTORY_MODULES, get_coordinator
+from .decode import compile_accessor
+from .endpoints import BINARY_SENSOR, describe, modules_for
+from .entity import DFPEntity
+from .registry import CLIENT_SCHEMA, INTERVAL_SCHEMA, client_from_config, interval_limits
+from .render import make_renderer
 
 _LOGGER = logging.getLogger(__name__)
 
-MIN_TIME_BETWEEN_UPDATES = timedelta(seconds=1)
-
 CONF_BINARY_SENSORS = "binary_sensors"
 CONF_USERNAME = "username"
 CONF_PASSWORD = "password"
 CONF_MODULE = "module"
 CONF_STATE = "state"
 
+ATTR_CHANGES = "changes_last_hour"
+# Seconds of history counted in the changes attribute
+CHANGES_WINDOW = 3600
+
 DEFAULT_NAME = "DFP sensor"
 
 SENSOR_FUNCTION_SCHEMA = vol.Schema(
@@ -40,7 +42,8 @@ SENSOR_FUNCTION_SCHEMA = vol.Schema(
         vol.Required(CONF_NAME): cv.string,
         vol.Required(CONF_MODULE): cv.string,
         vol.Required(CONF_STATE): cv.string,
-        vol.Optional(CONF_VALUE_TEMPLATE): cv.template
+        vol.Optional(CONF_VALUE_TEMPLATE): cv.template,
+        **INTERVAL_SCHEMA,
     }
 )
 
@@ -53,93 +56,62 @@ PLATFORM_SCHEMA = PLATFORM_SCHEMA.extend(
         vol.Required(CONF_BINARY_SENSORS): vol.Schema(
             {cv.string: SENSOR_FUNCTION_SCHEMA}
         ),
+        **CLIENT_SCHEMA,
     }
 )
 
 
-def setup_platform(hass, config, add_entities, discovery_info=None):
-    """Set up the DFP sensors."""
-
-    def make_renderer(value_template):
-        """Create a renderer based on variable_template value."""
-        if value_template is None:
-            return lambda value: value
-
-        value_template.hass = hass
-
-        def _render(value):
-            try:
-                return value_template.async_render({"value": value}, parse_result=False)
-            except TemplateError:
-                _LOGGER.exception("Error parsing value")
-                return value
-
-        return _render
+async def async_setup_platform(hass, config, async_add_entities, discovery_info=None):
+    """Set up the DFP binary sensors, their state comes with the first poll."""
 
+    client = client_from_config(hass, config)
+    await get_coordinator(client).async_restore(hass)
     dev = []
 
     sensors = config[CONF_BINARY_SENSORS]
     for sensorName, sensor in sensors.items():
-        renderer = make_renderer(sensor.get(CONF_VALUE_TEMPLATE))
-        try:
-            dfpBinarySensor = DFPBinarySensor(
+        renderer = make_renderer(hass, sensor.get(CONF_VALUE_TEMPLATE))
+        dev.append(
+            DFPBinarySensor(
                 config[CONF_NAME],
                 sensor.get(CONF_NAME),
-                config[CONF_RESOURCE],
-                config[CONF_USERNAME],
-                config[CONF_PASSWORD],
+                client,
                 sensor.get(CONF_MODULE),
                 sensor.get(CONF_STATE),
-                renderer
+                renderer,
+                *interval_limits(sensor)
             )
-        except requests.exceptions.MissingSchema:
-            _LOGGER.error(
-                "Missing resource or schema in configuration. Add http:// to your URL"
-            )
-            return False
-        except requests.exceptions.ConnectionError:
-            _LOGGER.error("No route to device at %s", config[CONF_RESOURCE])
-
-        dev.append(dfpBinarySensor)
+        )
 
-    add_entities(dev)
+    async_add_entities(dev)
 
 
 
-class DFPBinarySensor(BinarySensorEntity):
+class DFPBinarySensor(DFPEntity, BinarySensorEntity):
     """Representation of an DFP switch."""
 
-    def __init__(self, location,  name, url, username, password, module, state, renderer=None):
+    def __init__(self, location,  name, client, module, state, renderer=None, min_interval=None, max_interval=None):
         """Initialize the switch."""
         self._name = f"{location.title()} {name.title()}"
         self._module = module
-        self._url = url
+        self._url = client.url
         self._item = state
         self._value = None
-        self._client = Client(url, username, password)
+        self._client = client
         self._renderer = renderer
-        self._available = True
-
-        # Check if we can get status
-        try:
-            if self._module == "dfp":
-                self._value = self._client.dfpStatus(self._item)
-            elif self._module == "dfpIO":
-                self._value = self._client.dfpIO(self._item)
-            elif self._module == "tfp":
-                self._value = self._client.tfpStatus(self._item)
-            elif self._module == "tfpIO":
-                self._value = self._client.tfpIO(self._item)
-            else:
-                raise KeyError("Module must be dfp, dfpIO, tfp or tfpIO")
-        except requests.exceptions.ConnectionError:
-            _LOGGER.warning("No route to device %s", self._url)
-        except requests.HTTPError as e:
-            _LOGGER.error("Resource not found: %s", e)
-        except KeyError:
-            _LOGGER.error("No return_value received")
-        except ValueError:
-            _LOGGER.error("Response invalid")
+        self._available = False
+        self._coordinator = get_coordinator(self._client)
+        self._endpoint = None
+        self._accessor = compile_accessor(self._item)
+
+        # The attribute is checked against the first snapshot of the endpoint
+        modules = modules_for(BINARY_SENSOR)
+        if self._module not in modules:
+            _LOGGER.error("Module of %s must be %s", self._name, describe(modules))
+            return
+        self._endpoint = self._coordinator.subscribe(
+            self, self._module, None, min_interval, max_interval
+        )
 
     @property
     def name(self):
@@ -155,26 +127,13 @@ class DFPBinarySensor(BinarySensorEntity):
     def is_on(self):
         """Return true if the binary sensor is on."""
         return self._value
-    
-
-    @Throttle(MIN_TIME_BETWEEN_UPDATES)
-    def update(self):
-        """Get the latest data from aREST API and update the state."""
-        try:
-            if self._module == "dfp":
-                self._value = self._client.dfpStatus(self._item)
-            elif self._module == "dfpIO":
-                self._value = self._client.dfpIO(self._item)
-            elif self._module == "tfp":
-                self._value = self._client.tfpStatus(self._item)
-            elif self._module == "tfpIO":
-                self._value = self._client.tfpIO(self._item)
-            
-            self._available = True
-        except requests.exceptions.ConnectionError:
-            _LOGGER.warning("No route to device %s", self._url)
-            self._available = False
-        except Exception as e:
-            _LOGGER.error("Error when update %s", e)
-            self._available = False
 
+    @property
+    def extra_state_attributes(self):
+        """Return the writes skipped and how many times an IO point changed in the last hour."""
+        attributes = super().extra_state_attributes
+        if self._endpoint is not None and self._module in HISTORY_MODULES:
+            attributes[ATTR_CHANGES] = self._coordinator.history.edges(
+                self._endpoint, self._item, CHANGES_WINDOW
+            )
+        return attributes
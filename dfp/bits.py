@@ -0,0 +1,77 @@
+"""Pack the boolean IO points of a snapshot into integers to find the changed ones."""
+
+_MISSING = object()
+
+
+class PackedIO:
+    """
+    Boolean attributes of a snapshot packed in two integers.
+
+    values has the bit of each true attribute set, present the bit of each
+    boolean attribute of the snapshot, so a point turning false and a point
+    disappearing differ. Other attributes are kept aside as they are.
+    """
+
+    __slots__ = ("values", "present", "others")
+
+    def __init__(self, values=0, present=0, others=None):
+        self.values = values
+        self.present = present
+        self.others = others or {}
+
+
+class BitIndex:
+    """
+    Bit of each boolean attribute of a module, assigned the first time it is seen.
+
+    The index is shared by the snapshots of a module, so XOR-ing two packed
+    snapshots gives the bits of the points that changed.
+    """
+
+    def __init__(self):
+        self._bits = {}
+        self._names = []
+
+    def __len__(self):
+        return len(self._names)
+
+    def bit(self, name):
+        """Return the bit mask of an attribute, assign it if new."""
+        position = self._bits.get(name)
+        if position is None:
+            position = self._bits[name] = len(self._names)
+            self._names.append(name)
+        return 1 << position
+
+    def pack(self, snapshot):
+        """Return the PackedIO of a snapshot."""
+        values = present = 0
+        others = {}
+        for name, value in snapshot.items():
+            if isinstance(value, bool):
+                bit = self.bit(name)
+                present |= bit
+                if value:
+                    values |= bit
+            else:
+                others[name] = value
+        return PackedIO(values, present, others)
+
+    def names(self, mask):
+        """Return the names of the attributes whose bit is set in mask."""
+        names = []
+        while mask:
+            low = mask & -mask
+            names.append(self._names[low.bit_length() - 1])
+            mask ^= low
+        return names
+
+    def changes(self, previous, current):
+        """Return the names of the attributes that differ between two PackedIO."""
+        changed = set(
+            self.names((previous.values ^ current.values) | (previous.present ^ current.present))
+        )
+        for name in previous.others.keys() | current.others.keys():
+            if previous.others.get(name, _MISSING) != current.others.get(name, _MISSING):
+                changed.add(name)
+        return changed
@@ -0,0 +1,124 @@
+"""Fail fast on the controllers known to be unreachable."""
+import asyncio
+import logging
+import time
+from threading import Lock
+from urllib.parse import urlsplit
+
+import aiohttp
+import requests
+
+_LOGGER = logging.getLogger(__name__)
+
+# Connection failures in a row before a host is considered down
+FAILURE_THRESHOLD = 3
+# Seconds before a request probes a host considered down
+RESET_TIMEOUT = 30
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+_breakers = {}
+_lock = Lock()
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError, aiohttp.ClientConnectionError):
+    """Request not sent because its host is considered down."""
+
+
+def get_breaker(url):
+    """Return the breaker of the host of an URL, shared by all its clients."""
+    host = urlsplit(url).netloc
+    with _lock:
+        if host not in _breakers:
+            _breakers[host] = CircuitBreaker(host)
+        return _breakers[host]
+
+
+def unreachable(error):
+    """Return True if an error means the host didn't answer."""
+    return isinstance(
+        error,
+        (
+            requests.exceptions.ConnectionError,
+            requests.exceptions.Timeout,
+            aiohttp.ClientConnectionError,
+            asyncio.TimeoutError,
+        ),
+    ) and not isinstance(error, CircuitOpenError)
+
+
+class CircuitBreaker:
+    """
+    Connection state of one host, shared by the blocking and async requests.
+
+    Closed, requests are sent. After FAILURE_THRESHOLD connection failures in
+    a row the breaker opens and requests fail right away with
+    CircuitOpenError. After RESET_TIMEOUT seconds it is half-open: a single
+    request probes the host while the others keep failing fast. The probe
+    closes the breaker if the host answers, any HTTP status included, or
+    opens it for another RESET_TIMEOUT.
+    """
+
+    def __init__(self, host, failure_threshold=FAILURE_THRESHOLD, reset_timeout=RESET_TIMEOUT):
+        self._host = host
+        self._failure_threshold = failure_threshold
+        self._reset_timeout = reset_timeout
+        self._lock = Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = None
+
+    @property
+    def host(self):
+        return self._host
+
+    @property
+    def state(self):
+        return self._state
+
+    def allow(self):
+        """Raise CircuitOpenError unless a request can be sent now."""
+        with self._lock:
+            if self._state == CLOSED:
+                return
+            if self._state == OPEN:
+                elapsed = time.monotonic() - self._opened_at
+                if elapsed >= self._reset_timeout:
+                    # This request is the probe
+                    self._state = HALF_OPEN
+                    return
+                raise CircuitOpenError(
+                    "%s is unreachable, next probe in %d s"
+                    % (self._host, self._reset_timeout - elapsed)
+                )
+            raise CircuitOpenError("%s is unreachable, probe in progress" % self._host)
+
+    def record(self, error=None):
+        """Account the outcome of a request allowed by allow()."""
+        with self._lock:
+            if isinstance(error, asyncio.CancelledError):
+                if self._state == HALF_OPEN:
+                    # No outcome, the next request probes again
+                    self._state = OPEN
+                    self._opened_at = time.monotonic() - self._reset_timeout
+                return
+            if error is None or not unreachable(error):
+                if self._state != CLOSED:
+                    _LOGGER.info("%s is reachable again", self._host)
+                self._state = CLOSED
+                self._failures = 0
+                return
+
+            self._failures += 1
+            if self._state == HALF_OPEN or (
+                self._state == CLOSED and self._failures >= self._failure_threshold
+            ):
+                if self._state == CLOSED:
+                    _LOGGER.warning(
+                        "%s is unreachable, fail fast for %d s: %s",
+                        self._host, self._reset_timeout, error,
+                    )
+                self._state = OPEN
+                self._opened_at = time.monotonic()
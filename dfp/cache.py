@@ -0,0 +1,55 @@
+"""Response cache of the DFP client."""
+import time
+from collections import OrderedDict
+from threading import Lock
+
+MISSING = object()
+
+
+class TTLCache:
+    """
+    Thread-safe LRU cache where each entry expires after its own TTL.
+
+    When the cache is full, the least recently used entry is evicted.
+    """
+
+    def __init__(self, maxsize=32):
+        if maxsize < 1:
+            raise ValueError("Cache size must be a positive integer")
+
+        self._maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def get(self, key):
+        """Return the value of a key, or MISSING if absent or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return MISSING
+            expiration, value = entry
+            if time.monotonic() >= expiration:
+                del self._entries[key]
+                return MISSING
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        """Store a value for ttl seconds."""
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, prefix=""):
+        """Drop all the keys starting with prefix, or all the keys."""
+        with self._lock:
+            for key in [key for key in self._entries if key.startswith(prefix)]:
+                del self._entries[key]
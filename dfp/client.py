@@ -1,10 +1,42 @@
+import aiohttp
+import asyncio
+import base64
+import json
 import logging
 import requests
+import threading
 import time
-from .singleton import Singleton
+from .breaker import get_breaker
+from .cache import MISSING, TTLCache
+from .decode import compile_accessor, loads
+from .metrics import Metrics
+from .transport import TransportPolicy
 
+DEFAULT_POOL_SIZE = 10
+# Seconds an idle connection is kept open, 0 closes it after each request
+DEFAULT_KEEPALIVE = 15
+DEFAULT_CACHE_SIZE = 32
 
-class Client(metaclass=Singleton):
+# Seconds a response stays in cache, by endpoint prefix
+DEFAULT_CACHE_TTL = {
+    "/api/dfps": 1,
+    "/api/tfps": 1,
+    "/api/tanks": 5,
+}
+
+# Seconds without any byte, keep-alive comments included, before the event
+# stream is considered dropped
+STREAM_READ_TIMEOUT = 60
+
+# Token lifetime when the JWT has no exp claim
+DEFAULT_TOKEN_LIFETIME = 18000
+# Renew the token in background this many seconds before it expires
+TOKEN_REFRESH_AHEAD = 60
+# Delay before retrying a failed background renewal
+TOKEN_RETRY_DELAY = 30
+
+
+class Client():
 
     _username = None
     _password = None
@@ -12,10 +44,22 @@ class Client(metaclass=Singleton):
     _token = None
     _client = None
     _token_expiration = None
-    _timeout = None
+    _policy = None
+    _session = None
+    _cache = None
+    _cache_ttl = None
+    _validators = None
+    _token_lock = None
+    _async_token_lock = None
+    _refresh_timer = None
+    _refresh_task = None
+    _pool_size = None
+    _keepalive = None
+    _metrics = None
+    _breaker = None
 
 
-    def __init__(self, url, username, password):
+    def __init__(self, url, username, password, cache_ttl = None, cache_size = DEFAULT_CACHE_SIZE, pool_size = DEFAULT_POOL_SIZE, keepalive = DEFAULT_KEEPALIVE, policy = None):
         if url is None or not url:
             raise ValueError("URL must be a string")
         if username is None or not username:
@@ -27,28 +71,131 @@ class Client(metaclass=Singleton):
         self._username = username
         self._password = password
         self._token_expiration = time.time()
+        self._pool_size = pool_size
+        self._keepalive = keepalive
         self._client = requests.Session()
-        self._timeout = 10
+        self._policy = policy or TransportPolicy()
+        self._cache = TTLCache(cache_size)
+        self._cache_ttl = dict(DEFAULT_CACHE_TTL)
+        if cache_ttl is not None:
+            self._cache_ttl.update(cache_ttl)
+        self._validators = {}
+        self._metrics = Metrics()
+        self._breaker = get_breaker(url)
+        self._token_lock = threading.Lock()
+        self._async_token_lock = asyncio.Lock()
 
         self._client.headers.update({"Content-Type": "application/json"})
-    
-    
-    
+        adapter = requests.adapters.HTTPAdapter(pool_connections = 1, pool_maxsize = self._pool_size)
+        self._client.mount("http://", adapter)
+        self._client.mount("https://", adapter)
+        if self._keepalive == 0:
+            self._client.headers.update({"Connection": "close"})
+
+    @property
+    def url(self):
+        return self._url
+
+    @property
+    def username(self):
+        return self._username
+
+    @property
+    def metrics(self):
+        """Return the request statistics of the client."""
+        return self._metrics
+
     def getAccessToken(self):
         payload = {
             "username": self._username,
             "password": self._password
         }
-        r = requests.post("%s/token-auth" % self._url, json = payload, timeout =  self._timeout)
-
+        r = self._request("post", "/token-auth", json = payload)
         r.raise_for_status()
+        self._metrics.token_refreshed()
+
+        self._setToken(r.json()["token"])
 
-        self._token = r.json()["token"]
+    def close(self):
+        """Stop the background token renewal and close the blocking session."""
+        self._cancelRefresh()
+        self._client.close()
+
+    def _setToken(self, token, loop = None):
+        expiration = _jwtExpiration(token)
+        if expiration is None:
+            expiration = time.time() + DEFAULT_TOKEN_LIFETIME
+
+        self._token = token
         self._client.headers.update({"Authorization": "Bearer %s" % self._token})
-        self._token_expiration = time.time() + 18000
+        self._token_expiration = expiration
+        self._scheduleRefresh(expiration, loop)
 
         logging.debug("Auth successfully")
 
+    def _tokenExpired(self):
+        return self._token is None or time.time() > self._token_expiration
+
+    def _renewToken(self, stale = None):
+        # Single flight: the threads waiting on the lock reuse the token
+        # obtained by the first one instead of asking for their own
+        with self._token_lock:
+            if self._token != stale and not self._tokenExpired():
+                return
+            self.getAccessToken()
+
+    async def _async_renew_token(self, stale = None):
+        async with self._async_token_lock:
+            if self._token != stale and not self._tokenExpired():
+                return
+            await self.async_get_access_token()
+
+    def _scheduleRefresh(self, expiration, loop = None):
+        remaining = expiration - time.time()
+        delay = max(remaining - TOKEN_REFRESH_AHEAD, remaining / 2, TOKEN_RETRY_DELAY)
+        self._startRefreshTimer(delay, loop)
+
+    def _startRefreshTimer(self, delay, loop = None):
+        # A token obtained by a coroutine is renewed on its event loop, one
+        # obtained by the blocking API from a thread
+        self._cancelRefresh()
+        if loop is not None:
+            self._refresh_timer = loop.call_later(delay, self._startAsyncRefresh, loop)
+            return
+        self._refresh_timer = threading.Timer(delay, self._backgroundRefresh)
+        self._refresh_timer.daemon = True
+        self._refresh_timer.start()
+
+    def _cancelRefresh(self):
+        if self._refresh_timer is not None:
+            self._refresh_timer.cancel()
+            self._refresh_timer = None
+
+    def _backgroundRefresh(self):
+        # Renew the token before it expires so no entity update has to wait
+        # for /token-auth
+        try:
+            with self._token_lock:
+                self.getAccessToken()
+        except Exception as e:
+            logging.warning("Can't renew token in background: %s", e)
+            if time.time() + TOKEN_RETRY_DELAY < self._token_expiration:
+                self._startRefreshTimer(TOKEN_RETRY_DELAY)
+
+    def _startAsyncRefresh(self, loop):
+        self._refresh_timer = None
+        self._refresh_task = loop.create_task(self._async_background_refresh(loop))
+
+    async def _async_background_refresh(self, loop):
+        # Same as _backgroundRefresh, single flight with the coroutines
+        # renewing an expired token
+        try:
+            await self._async_renew_token(self._token)
+        except Exception as e:
+            logging.warning("Can't renew token in background: %s", e)
+            if time.time() + TOKEN_RETRY_DELAY < self._token_expiration:
+                self._startRefreshTimer(TOKEN_RETRY_DELAY, loop)
+
     
     class Decorators():
         @staticmethod
@@ -56,15 +203,28 @@ class Client(metaclass=Singleton):
             # the function that is used to check
             # the JWT and refresh if necessary
             def wrapper(api,*args,**kwargs):
-                if time.time() > api._token_expiration:
+                if api._tokenExpired():
                     try:
-                        api.getAccessToken()
+                        api._renewToken(api._token)
                     except Exception as e:
                         logging.error(e)
                 return decorated(api,*args,**kwargs)
 
             return wrapper
 
+        @staticmethod
+        def asyncRefreshToken(decorated):
+            # Same as refreshToken for the coroutines of the client
+            async def wrapper(api,*args,**kwargs):
+                if api._tokenExpired():
+                    try:
+                        await api._async_renew_token(api._token)
+                    except Exception as e:
+                        logging.error(e)
+                return await decorated(api,*args,**kwargs)
+
+            return wrapper
+
     
     @Decorators.refreshToken
     def dfpAction(self, action):
@@ -72,7 +232,8 @@ class Client(metaclass=Singleton):
         if action is None or not action:
             raise ValueError("Action must be a string")
 
-        r = self._client.post("%s/api/dfps/action/%s" % (self._url, action), timeout =  self._timeout)
+        r = self._send("post", "/api/dfps/action/%s" % action)
+        self._cache.invalidate("/api/dfps")
 
         r.raise_for_status()
 
@@ -80,22 +241,18 @@ class Client(metaclass=Singleton):
     
     
     @Decorators.refreshToken
-    def dfpStatus(self, item):
+    def dfpStatus(self, item, cache = False):
         if item is None or not item:
             raise ValueError("Item must be a string")
 
-        r = self._client.get("%s/api/dfps" % self._url, timeout =  self._timeout)
-        r.raise_for_status()
-        return r.json()["data"]["attributes"][item]
+        return compile_accessor(item)(self.dfpSnapshot(cache))
     
     @Decorators.refreshToken
     def dfpIO(self, item, cache = False):
         if item is None or not item:
             raise ValueError("Item must be a string")
 
-        r = self._client.get("%s/api/dfps/io" % self._url, timeout =  self._timeout)
-        r.raise_for_status()
-        return r.json()["data"]["attributes"][item]
+        return compile_accessor(item)(self.dfpIOSnapshot(cache))
 
     @Decorators.refreshToken
     def tfpAction(self, action):
@@ -103,7 +260,8 @@ class Client(metaclass=Singleton):
         if action is None or not action:
             raise ValueError("Action must be a string")
 
-        r = self._client.post("%s/api/tfps/action/%s" % (self._url, action), timeout =  self._timeout)
+        r = self._send("post", "/api/tfps/action/%s" % action)
+        self._cache.invalidate("/api/tfps")
 
         r.raise_for_status()
 
@@ -115,32 +273,402 @@ class Client(metaclass=Singleton):
         if item is None or not item:
             raise ValueError("Item must be a string")
 
-        r = self._client.get("%s/api/tfps" % self._url, timeout =  self._timeout)
-        r.raise_for_status()
-        return r.json()["data"]["attributes"][item]
+        return compile_accessor(item)(self.tfpSnapshot(cache))
 
     @Decorators.refreshToken
     def tankStatus(self, item, name,  cache = False):
         if item is None or not item:
             raise ValueError("Item must be a string")
-        if name is None or not name:
-            raise ValueError("Name must be a string")
 
-        r = self._client.get("%s/api/tanks/%s" % (self._url, name), timeout =  self._timeout)
-        r.raise_for_status()
-        return r.json()["data"]["attributes"][item]
+        return compile_accessor(item)(self.tankSnapshot(name, cache))
     
     @Decorators.refreshToken
     def tfpIO(self, item, cache = False):
         if item is None or not item:
             raise ValueError("Item must be a string")
-    
-        r = self._client.get("%s/api/tfps/io" % self._url, timeout =  self._timeout)
-        r.raise_for_status()
-        return r.json()["data"]["attributes"][item]
-        
-    
+
+        return compile_accessor(item)(self.tfpIOSnapshot(cache))
+
+
+    @Decorators.refreshToken
+    def dfpSnapshot(self, cache = False):
+        """Return all attributes of the DFP in one request."""
+        return self._get("/api/dfps", cache)
+
+    @Decorators.refreshToken
+    def dfpIOSnapshot(self, cache = False):
+        """Return all IO of the DFP in one request."""
+        return self._get("/api/dfps/io", cache)
+
+    @Decorators.refreshToken
+    def tfpSnapshot(self, cache = False):
+        """Return all attributes of the TFP in one request."""
+        return self._get("/api/tfps", cache)
+
+    @Decorators.refreshToken
+    def tfpIOSnapshot(self, cache = False):
+        """Return all IO of the TFP in one request."""
+        return self._get("/api/tfps/io", cache)
+
+    @Decorators.refreshToken
+    def tankSnapshot(self, name, cache = False):
+        """Return all attributes of a tank in one request."""
+        if name is None or not name:
+            raise ValueError("Name must be a string")
+
+        return self._get("/api/tanks/%s" % name, cache)
+
+
+    def _get(self, path, cache = False, extract = None):
+        if cache:
+            data = self._cache.get(path)
+            if data is not MISSING:
+                return data
+
+        r = self._send("get", path, headers = self._conditionalHeaders(path))
+        if r.status_code == 304:
+            data = self._notModified(path)
+        else:
+            r.raise_for_status()
+            data = (extract or _attributes)(loads(r.content))
+            self._storeValidators(path, r.headers, data)
+        self._cache.set(path, data, self._cacheTTL(path))
+        return data
+
+    def _send(self, method, path, **kwargs):
+        # A rejected token is renewed once and the request replayed
+        token = self._token
+        r = self._request(method, path, **kwargs)
+        if r.status_code == 401:
+            logging.debug("Token rejected on %s, renew it", path)
+            self._renewToken(token)
+            r = self._request(method, path, **kwargs)
+        return r
+
+    def _request(self, method, path, **kwargs):
+        # Each attempt goes through the breaker of the host, so requests to
+        # a host known to be down fail right away, and is accounted in the
+        # metrics its timeouts are derived from
+        attempt = 0
+        while True:
+            self._breaker.allow()
+            timeout = self._policy.timeouts(self._metrics.endpoint(path))
+            start = time.perf_counter()
+            try:
+                r = self._client.request(method, "%s%s" % (self._url, path), timeout = timeout, **kwargs)
+            except BaseException as e:
+                self._breaker.record(e)
+                if not isinstance(e, Exception):
+                    raise
+                self._metrics.record(path, time.perf_counter() - start, error = e)
+                if not self._policy.retry(method, attempt, error = e):
+                    raise
+            else:
+                self._breaker.record()
+                self._metrics.record(path, time.perf_counter() - start, len(r.content), _statusError(r.status_code))
+                if not self._policy.retry(method, attempt, status = r.status_code):
+                    return r
+                r.close()
+            logging.debug("Retry %s %s", method, path)
+            time.sleep(self._policy.delay(attempt))
+            attempt += 1
+
+    def _cacheTTL(self, path):
+        # The longest matching prefix wins, so /api/dfps/io can be tuned
+        # apart from /api/dfps
+        prefixes = [prefix for prefix in self._cache_ttl if path.startswith(prefix)]
+        if not prefixes:
+            return 0
+        return self._cache_ttl[max(prefixes, key = len)]
+
+    def _conditionalHeaders(self, path):
+        # Revalidate the last document instead of downloading it again
+        validator = self._validators.get(path)
+        if validator is None:
+            return {}
+
+        etag, lastModified, _ = validator
+        headers = {}
+        if etag is not None:
+            headers["If-None-Match"] = etag
+        if lastModified is not None:
+            headers["If-Modified-Since"] = lastModified
+        return headers
+
+    def _storeValidators(self, path, headers, data):
+        etag = headers.get("ETag")
+        lastModified = headers.get("Last-Modified")
+        if etag is None and lastModified is None:
+            self._validators.pop(path, None)
+        else:
+            self._validators[path] = (etag, lastModified, data)
+
+    def _notModified(self, path):
+        validator = self._validators.get(path)
+        if validator is None:
+            raise ValueError("Not modified received for %s without previous document" % path)
+
+        logging.debug("%s not modified", path)
+        return validator[2]
+
+
+    def _getSession(self):
+        # The session must be created from the event loop, so it can't be
+        # done in __init__. All coroutines share its connection pool.
+        if self._session is None or self._session.closed:
+            if self._keepalive == 0:
+                connector = aiohttp.TCPConnector(limit=self._pool_size, force_close=True)
+            else:
+                connector = aiohttp.TCPConnector(limit=self._pool_size, keepalive_timeout=self._keepalive)
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                headers={"Content-Type": "application/json"},
+                timeout=aiohttp.ClientTimeout(total=self._policy.timeout),
+            )
+        return self._session
+
+    def _authHeaders(self):
+        if self._token is None:
+            return {}
+        return {"Authorization": "Bearer %s" % self._token}
+
+    async def async_close(self):
+        """Close the connection pool used by the coroutines."""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+        self._cancelRefresh()
+        task, self._refresh_task = self._refresh_task, None
+        if task is not None and task is not asyncio.current_task():
+            task.cancel()
+
+    async def async_get_access_token(self):
+        payload = {
+            "username": self._username,
+            "password": self._password
+        }
+        async with await self._async_request("post", "/token-auth", json = payload) as r:
+            r.raise_for_status()
+            body = await r.read()
+        self._metrics.token_refreshed()
+
+        self._setToken(loads(body)["token"], asyncio.get_running_loop())
+
+    async def async_dfp_action(self, action):
+        if action is None or not action:
+            raise ValueError("Action must be a string")
+
+        await self.async_action("/api/dfps/action/%s" % action, "/api/dfps")
+
+    async def async_tfp_action(self, action):
+        if action is None or not action:
+            raise ValueError("Action must be a string")
+
+        await self.async_action("/api/tfps/action/%s" % action, "/api/tfps")
+
+    @Decorators.asyncRefreshToken
+    async def async_action(self, path, invalidate = None):
+        """Run the action at path, then drop the cached responses under invalidate."""
+        try:
+            text = await self._async_post(path)
+        finally:
+            if invalidate is not None:
+                self._cache.invalidate(invalidate)
+
+        logging.info("Run action %s successfully: %s", path, text)
+
+    async def async_dfp_status(self, item, cache = False):
+        if item is None or not item:
+            raise ValueError("Item must be a string")
+
+        return compile_accessor(item)(await self.async_dfp_snapshot(cache))
+
+    async def async_dfp_io(self, item, cache = False):
+        if item is None or not item:
+            raise ValueError("Item must be a string")
+
+        return compile_accessor(item)(await self.async_dfp_io_snapshot(cache))
+
+    async def async_tfp_status(self, item, cache = False):
+        if item is None or not item:
+            raise ValueError("Item must be a string")
+
+        return compile_accessor(item)(await self.async_tfp_snapshot(cache))
+
+    async def async_tfp_io(self, item, cache = False):
+        if item is None or not item:
+            raise ValueError("Item must be a string")
+
+        return compile_accessor(item)(await self.async_tfp_io_snapshot(cache))
+
+    async def async_tank_status(self, item, name, cache = False):
+        if item is None or not item:
+            raise ValueError("Item must be a string")
+
+        return compile_accessor(item)(await self.async_tank_snapshot(name, cache))
+
+    @Decorators.asyncRefreshToken
+    async def async_snapshot(self, path, cache = False):
+        """Return all attributes of the resource at path in one request."""
+        return await self._async_get(path, cache)
+
+    @Decorators.asyncRefreshToken
+    async def async_listing(self, path, cache = False):
+        """Return the attributes of the resources listed at path, by name."""
+        return await self._async_get(path, cache, _tankIndex)
+
+    @Decorators.asyncRefreshToken
+    async def async_dfp_snapshot(self, cache = False):
+        """Return all attributes of the DFP in one request."""
+        return await self._async_get("/api/dfps", cache)
+
+    @Decorators.asyncRefreshToken
+    async def async_dfp_io_snapshot(self, cache = False):
+        """Return all IO of the DFP in one request."""
+        return await self._async_get("/api/dfps/io", cache)
+
+    @Decorators.asyncRefreshToken
+    async def async_tfp_snapshot(self, cache = False):
+        """Return all attributes of the TFP in one request."""
+        return await self._async_get("/api/tfps", cache)
+
+    @Decorators.asyncRefreshToken
+    async def async_tfp_io_snapshot(self, cache = False):
+        """Return all IO of the TFP in one request."""
+        return await self._async_get("/api/tfps/io", cache)
+
+    @Decorators.asyncRefreshToken
+    async def async_tank_snapshot(self, name, cache = False):
+        """Return all attributes of a tank in one request."""
+        if name is None or not name:
+            raise ValueError("Name must be a string")
+
+        return await self._async_get("/api/tanks/%s" % name, cache)
+
+
+    async def async_events(self):
+        """
+        Yield (module, id, attributes) for each change pushed by the controller.
+
+        Reads the server-sent events of /api/events until the connection
+        drops, see README for the contract.
+        """
+        if self._tokenExpired():
+            await self._async_renew_token(self._token)
+
+        timeout = aiohttp.ClientTimeout(total = None, sock_read = STREAM_READ_TIMEOUT)
+        headers = {"Accept": "text/event-stream"}
+        async with await self._async_send("get", "/api/events", headers, timeout = timeout) as r:
+            r.raise_for_status()
+            event = None
+            data = []
+            async for line in r.content:
+                line = line.decode("utf-8").rstrip("\r\n")
+                if line.startswith(":"):
+                    # Keep-alive comment
+                    continue
+                if line:
+                    field, _, value = line.partition(":")
+                    value = value[1:] if value.startswith(" ") else value
+                    if field == "event":
+                        event = value
+                    elif field == "data":
+                        data.append(value)
+                    continue
+
+                if event is not None and data:
+                    document = loads("\n".join(data))["data"]
+                    yield event, document.get("id"), document["attributes"]
+                event = None
+                data = []
+
+    async def _async_get(self, path, cache = False, extract = None):
+        if cache:
+            data = self._cache.get(path)
+            if data is not MISSING:
+                return data
+
+        async with await self._async_send("get", path, self._conditionalHeaders(path)) as r:
+            if r.status == 304:
+                data = self._notModified(path)
+            else:
+                r.raise_for_status()
+                data = (extract or _attributes)(loads(await r.read()))
+                self._storeValidators(path, r.headers, data)
+        self._cache.set(path, data, self._cacheTTL(path))
+        return data
+
+    async def _async_post(self, path):
+        async with await self._async_send("post", path) as r:
+            r.raise_for_status()
+            return await r.text()
+
+    async def _async_send(self, method, path, headers = None, **kwargs):
+        token = self._token
+        r = await self._async_request(method, path, headers = {**self._authHeaders(), **(headers or {})}, **kwargs)
+        if r.status == 401:
+            logging.debug("Token rejected on %s, renew it", path)
+            r.release()
+            await self._async_renew_token(token)
+            r = await self._async_request(method, path, headers = {**self._authHeaders(), **(headers or {})}, **kwargs)
+        return r
+
+    async def _async_request(self, method, path, timeout = None, **kwargs):
+        # The latency is measured up to the response headers, the size is
+        # the announced Content-Length
+        attempt = 0
+        while True:
+            self._breaker.allow()
+            if timeout is None:
+                connect, read = self._policy.timeouts(self._metrics.endpoint(path))
+                attemptTimeout = aiohttp.ClientTimeout(total = None, sock_connect = connect, sock_read = read)
+            else:
+                attemptTimeout = timeout
+            start = time.perf_counter()
+            try:
+                r = await self._getSession().request(method, "%s%s" % (self._url, path), timeout = attemptTimeout, **kwargs)
+            except BaseException as e:
+                self._breaker.record(e)
+                if not isinstance(e, Exception):
+                    raise
+                self._metrics.record(path, time.perf_counter() - start, error = e)
+                if not self._policy.retry(method, attempt, error = e):
+                    raise
+            else:
+                self._breaker.record()
+                self._metrics.record(path, time.perf_counter() - start, r.content_length or 0, _statusError(r.status))
+                if not self._policy.retry(method, attempt, status = r.status):
+                    return r
+                r.release()
+            logging.debug("Retry %s %s", method, path)
+            await asyncio.sleep(self._policy.delay(attempt))
+            attempt += 1
+
+
+def _statusError(status):
+    if status >= 400:
+        return "HTTP %d" % status
+    return None
+
+
+def _attributes(document):
+    return document["data"]["attributes"]
 
 
+def _tankIndex(document):
+    # The listing holds one resource per tank, identified by its name
+    index = {}
+    for tank in document["data"]:
+        name = tank.get("id") or tank["attributes"].get("name")
+        index[name] = tank["attributes"]
+    return index
 
 
+def _jwtExpiration(token):
+    """Return the exp claim of a JWT, without checking its signature."""
+    try:
+        payload = token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        return float(json.loads(base64.urlsafe_b64decode(payload))["exp"])
+    except (AttributeError, IndexError, KeyError, TypeError, ValueError):
+        return None
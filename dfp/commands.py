@@ -0,0 +1,138 @@
+"""Send the actions of a DFP controller in order from one worker."""
+import asyncio
+import logging
+from collections import OrderedDict
+from threading import Lock
+
+import aiohttp
+
+from .breaker import CircuitOpenError
+from .endpoints import get_module
+
+_LOGGER = logging.getLogger(__name__)
+
+# Seconds before replaying an action the controller didn't receive
+REPLAY_DELAY = 5
+MAX_REPLAY_DELAY = 60
+
+_queues = {}
+_lock = Lock()
+
+
+def get_command_queue(client):
+    """Return the command queue of a client, create it on first use."""
+    with _lock:
+        if client not in _queues:
+            _queues[client] = CommandQueue(client)
+        return _queues[client]
+
+
+def remove_command_queue(client):
+    """Forget the command queue of a client and return it."""
+    with _lock:
+        return _queues.pop(client, None)
+
+
+class CommandQueue:
+    """
+    Pending actions of a controller, sent in order by a single worker.
+
+    An action submitted for a switch supersedes the one still pending for
+    the same switch, so start/stop/start only sends start. Every caller gets
+    a future resolved once the winning action is acknowledged. Actions that
+    never left the client, because the controller can't be connected to,
+    stay queued and are replayed when it's back. An action that may have
+    been received, on a read timeout or a dropped connection, fails instead
+    of running twice.
+    """
+
+    def __init__(self, client):
+        self._client = client
+        self._pending = OrderedDict()
+        self._worker = None
+
+    def __len__(self):
+        return len(self._pending)
+
+    def submit(self, key, module, action):
+        """Queue an action for the switch key, must run in the event loop."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        future.add_done_callback(_consume)
+        futures = [future]
+
+        superseded = self._pending.pop(key, None)
+        if superseded is not None:
+            _LOGGER.debug("Action %s supersedes %s on %s", action, superseded[1], key)
+            futures = superseded[2] + futures
+        self._pending[key] = (module, action, futures)
+
+        if self._worker is None or self._worker.done():
+            self._worker = loop.create_task(self._async_run())
+        return future
+
+    async def async_stop(self):
+        """Stop the worker and fail the actions not sent yet."""
+        if self._worker is not None:
+            self._worker.cancel()
+        while self._pending:
+            _, (_, action, futures) = self._pending.popitem(last=False)
+            _LOGGER.warning("Action %s dropped, it was not sent to %s", action, self._client.url)
+            for future in futures:
+                if not future.done():
+                    future.cancel()
+
+    async def _async_run(self):
+        delay = REPLAY_DELAY
+        while self._pending:
+            # The action in flight leaves the queue, so one submitted in the
+            # meantime for the same switch is sent after it
+            key, (module, action, futures) = self._pending.popitem(last=False)
+            try:
+                await self._async_send(module, action)
+            except (aiohttp.ClientConnectorError, CircuitOpenError) as e:
+                _LOGGER.warning(
+                    "Can't reach %s, action %s will be replayed in %s s: %s",
+                    self._client.url, action, delay, e,
+                )
+                self._requeue(key, module, action, futures)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, MAX_REPLAY_DELAY)
+                continue
+            except Exception as e:
+                _LOGGER.error("Action %s failed on %s: %s", action, self._client.url, e)
+                _resolve(futures, exception=e)
+            else:
+                _resolve(futures, result=True)
+            delay = REPLAY_DELAY
+
+    def _requeue(self, key, module, action, futures):
+        newer = self._pending.get(key)
+        if newer is not None:
+            # Superseded while it was in flight
+            self._pending[key] = (newer[0], newer[1], futures + newer[2])
+            return
+        self._pending[key] = (module, action, futures)
+        self._pending.move_to_end(key, last=False)
+
+    async def _async_send(self, module, action):
+        spec = get_module(module)
+        if spec.action is None:
+            raise KeyError("Module %s has no action" % module)
+        await self._client.async_action(spec.action % action, spec.path)
+
+
+def _consume(future):
+    # Callers may stop waiting for an ack, don't warn about its exception
+    if not future.cancelled():
+        future.exception()
+
+
+def _resolve(futures, result=None, exception=None):
+    for future in futures:
+        if future.done():
+            continue
+        if exception is not None:
+            future.set_exception(exception)
+        else:
+            future.set_result(result)
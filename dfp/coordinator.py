@@ -0,0 +1,543 @@
+"""Share the DFP API snapshots between all the entities of a controller."""
+import asyncio
+import logging
+import time
+from threading import Lock
+
+import aiohttp
+import requests
+
+from homeassistant.helpers.storage import Store
+from homeassistant.util import slugify
+
+from .bits import BitIndex
+from .endpoints import MODULES, get_module
+from .engine import get_engine
+from .history import History
+from .scheduler import Schedule
+
+_LOGGER = logging.getLogger(__name__)
+
+# Floor and ceiling of the polling interval of an endpoint, in seconds
+DEFAULT_INTERVAL = 1
+DEFAULT_MAX_INTERVAL = 30
+MODULE_INTERVALS = {
+    name: module.intervals for name, module in MODULES.items() if module.intervals is not None
+}
+# Modules of the IO points whose changes are kept in memory
+HISTORY_MODULES = tuple(name for name, module in MODULES.items() if module.history)
+# Modules whose snapshots are compared as bits
+PACKED_MODULES = tuple(name for name, module in MODULES.items() if module.packed)
+# Version of the saved snapshots, and seconds between their writes
+STORAGE_VERSION = 1
+SAVE_DELAY = 60
+# Seconds before reconnecting a dropped event stream
+STREAM_RETRY_DELAY = 5
+MAX_STREAM_RETRY_DELAY = 300
+
+# Errors of an endpoint whose controller didn't answer
+_UNREACHABLE = (
+    requests.exceptions.ConnectionError,
+    requests.exceptions.Timeout,
+    aiohttp.ClientConnectionError,
+    asyncio.TimeoutError,
+)
+
+_coordinators = {}
+_lock = Lock()
+
+
+def get_coordinator(client):
+    """Return the coordinator of a client, create it on first use."""
+    with _lock:
+        if client not in _coordinators:
+            _coordinators[client] = Coordinator(client)
+        return _coordinators[client]
+
+
+def remove_coordinator(client):
+    """Forget the coordinator of a client and return it."""
+    with _lock:
+        return _coordinators.pop(client, None)
+
+
+class Coordinator:
+    """
+    Fetch each endpoint of a DFP controller when its schedule is due.
+
+    Sensors, binary sensors and switches subscribe to the endpoint they read
+    from. Each endpoint is polled on its own adaptive schedule: fast while
+    its snapshot changes, slower while it is stable, backing off while it
+    fails (see Schedule). The floor and ceiling come from the module, or
+    from the most demanding entity subscribed to the endpoint.
+    Once entities are added, a background task polls the due endpoints with
+    several requests in flight, within the limits of the PollingEngine shared
+    by all the controllers, and calls the listeners with the endpoints whose
+    snapshot changed or failed: the first poll fetches each endpoint once for
+    all the entities set up on it. Entities don't poll by themselves.
+
+    When the stream is enabled, the changes pushed by the controller are
+    merged into the snapshots and the listeners are called with the endpoint
+    that changed. Endpoints aren't polled while the stream is up.
+
+    The snapshots of packed modules are packed as bits (see BitIndex): the
+    XOR with the previous snapshot gives the IO points that changed, and
+    only the listeners of these points are called.
+
+    Changes of the dfpIO and tfpIO attributes, polled or pushed, are kept in
+    a History to count how often an IO point toggled without the recorder.
+
+    The last good snapshot of each endpoint is saved in the Home Assistant
+    storage. Restored at startup, the snapshots are stale until their first
+    fetch succeeds and survive the failed fetches meanwhile, so entities
+    show the last known values while the controller is down.
+    """
+
+    def __init__(self, client, intervals=None):
+        self._client = client
+        self._intervals = dict(MODULE_INTERVALS, **(intervals or {}))
+        self._lock = Lock()
+        self._async_lock = asyncio.Lock()
+        self._subscribers = {}
+        self._limits = {}
+        self._fetchers = {}
+        self._schedules = {}
+        self._snapshots = {}
+        self._errors = {}
+        self._listeners = {}
+        self._bit_indexes = {}
+        self._packed = {}
+        self._changed = {}
+        self._history = History()
+        self._storage = None
+        self._restore = None
+        self._saved = {}
+        self._stale = set()
+        self._unlisted = set()
+        self._engine = get_engine()
+        self._stream = False
+        self._stream_task = None
+        self._streaming = False
+        self._poll_task = None
+        self._wakeup = None
+        self._loop = None
+
+    @property
+    def history(self):
+        """Return the History of the IO points, by endpoint and attribute."""
+        return self._history
+
+    @property
+    def streaming(self):
+        """Return True while the controller pushes its changes."""
+        return self._streaming
+
+    def enable_stream(self):
+        """Subscribe to the event stream once entities are added."""
+        self._stream = True
+
+    def async_add_listener(self, listener, endpoint=None, attribute=None):
+        """
+        Call listener(endpoint) when a snapshot changes or fails, return the remove callback.
+
+        With endpoint, only its changes are notified. With attribute too,
+        only the changes of this top-level attribute when they are known,
+        from the stream or a packed snapshot.
+        """
+        listeners = self._listeners.setdefault(endpoint, {}).setdefault(attribute, [])
+        listeners.append(listener)
+
+        def remove_listener():
+            listeners.remove(listener)
+
+        return remove_listener
+
+    def set_intervals(self, module, floor=None, ceiling=None):
+        """Change the default floor and ceiling of the endpoints of a module."""
+        default_floor, default_ceiling = self._module_intervals(module)
+        with self._lock:
+            self._intervals[module] = (
+                default_floor if floor is None else floor,
+                default_ceiling if ceiling is None else ceiling,
+            )
+            for endpoint in self._subscribers:
+                if endpoint[0] == module:
+                    self._update_schedule(endpoint)
+        self._wake()
+
+    async def async_restore(self, hass):
+        """Load the snapshots saved by the last run as stale snapshots, once."""
+        if self._restore is None:
+            self._storage = Store(
+                hass, STORAGE_VERSION, "dfp.snapshots_%s" % slugify(self._client.url), atomic_writes=True
+            )
+            self._restore = hass.async_create_task(self._async_load())
+        await self._restore
+
+    def stale(self, endpoint):
+        """Return True while the snapshot of an endpoint is the one restored."""
+        return endpoint in self._stale
+
+    def known(self, endpoint):
+        """Return True if an endpoint has a snapshot, restored or fetched, or an error."""
+        return endpoint in self._snapshots or endpoint in self._errors
+
+    def async_start(self, hass):
+        """Start polling, and the event stream if enabled, unless running yet."""
+        if self._poll_task is None:
+            self._loop = hass.loop
+            self._wakeup = asyncio.Event()
+            self._poll_task = hass.async_create_background_task(
+                self._async_poll(), "dfp poll %s" % self._client.url
+            )
+        if self._stream and self._stream_task is None:
+            self._stream_task = hass.async_create_background_task(
+                self._async_stream(), "dfp event stream %s" % self._client.url
+            )
+
+    async def async_stop(self):
+        """Stop polling and the event stream."""
+        for task in (self._poll_task, self._stream_task):
+            if task is None:
+                continue
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._poll_task = None
+        self._stream_task = None
+        self._wakeup = None
+        self._streaming = False
+
+    async def async_refresh_endpoint(self, endpoint):
+        """Fetch one endpoint now, notify its listeners if it changed and return its snapshot."""
+        async with self._async_lock:
+            try:
+                result = await self._async_fetch(endpoint)
+            except Exception as e:
+                result = e
+            changed = self._store(endpoint, result)
+        if changed:
+            self._notify(endpoint)
+        return self.last(endpoint)
+
+    @staticmethod
+    def endpoint(module, submodule=None):
+        """Return the key of the endpoint that serves a module."""
+        spec = MODULES.get(module)
+        if spec is None:
+            return (module, None)
+        return spec.key(submodule)
+
+    def subscribe(self, entity, module, submodule=None, floor=None, ceiling=None):
+        """
+        Register an entity on an endpoint and return the endpoint key.
+
+        floor and ceiling override the polling interval limits of the module
+        for this entity, in seconds.
+        """
+        endpoint = self.endpoint(module, submodule)
+        with self._lock:
+            self._subscribers.setdefault(endpoint, set()).add(entity)
+            self._limits.setdefault(endpoint, {})[entity] = (floor, ceiling)
+            if endpoint not in self._fetchers and module in MODULES:
+                # Resolved once, polls call it directly
+                self._fetchers[endpoint] = MODULES[module].fetcher(self._client, submodule)
+            self._update_schedule(endpoint)
+        # A new endpoint is due now, not after the current sleep
+        self._wake()
+        return endpoint
+
+    def unsubscribe(self, entity, endpoint):
+        """Remove an entity from an endpoint."""
+        with self._lock:
+            subscribers = self._subscribers.get(endpoint)
+            if subscribers is None:
+                return
+            subscribers.discard(entity)
+            self._limits[endpoint].pop(entity, None)
+            if not subscribers:
+                del self._subscribers[endpoint]
+                del self._limits[endpoint]
+                self._fetchers.pop(endpoint, None)
+                self._schedules.pop(endpoint, None)
+                self._snapshots.pop(endpoint, None)
+                self._errors.pop(endpoint, None)
+                self._stale.discard(endpoint)
+                self._packed.pop(endpoint, None)
+                self._changed.pop(endpoint, None)
+                self._history.forget(endpoint)
+            else:
+                self._update_schedule(endpoint)
+
+    async def async_refresh(self, force=False):
+        """
+        Fetch the due endpoints concurrently, all the subscribed ones if forced.
+
+        Return the endpoints whose snapshot changed or failed.
+        """
+        async with self._async_lock:
+            endpoints = self._due(force)
+            if not endpoints:
+                return []
+            start = time.monotonic()
+            listed = {}
+            others = []
+            for endpoint in endpoints:
+                if self._listed(endpoint[0]):
+                    listed.setdefault(endpoint[0], []).append(endpoint)
+                else:
+                    others.append(endpoint)
+            batches = list(listed.items())
+            results = await asyncio.gather(
+                *(self._async_fetch_listing(module, batch) for module, batch in batches),
+                *(self._async_fetch(endpoint) for endpoint in others),
+                return_exceptions=True,
+            )
+            fetched = list(zip(others, results[len(batches):]))
+            for (_, batch), batchResults in zip(batches, results):
+                if isinstance(batchResults, BaseException):
+                    batchResults = [batchResults] * len(batch)
+                fetched += zip(batch, batchResults)
+            self._engine.record_cycle(self._client.url, time.monotonic() - start)
+            return [endpoint for endpoint, result in fetched if self._store(endpoint, result)]
+
+    def last(self, endpoint):
+        """Return the snapshot of an endpoint without refreshing it."""
+        error = self._errors.get(endpoint)
+        if error is not None:
+            raise error
+        return self._snapshots[endpoint]
+
+    def _due(self, force):
+        now = time.monotonic()
+        endpoints = [
+            endpoint
+            for endpoint, schedule in list(self._schedules.items())
+            if force or schedule.due(now)
+        ]
+        listed = {endpoint[0] for endpoint in endpoints if self._listed(endpoint[0])}
+        if listed:
+            # One listing serves all the endpoints of a module, refresh them together
+            endpoints += [
+                endpoint
+                for endpoint in list(self._schedules)
+                if endpoint[0] in listed and endpoint not in endpoints
+            ]
+        return endpoints
+
+    def _listed(self, module):
+        spec = MODULES.get(module)
+        return spec is not None and spec.listing is not None and module not in self._unlisted
+
+    def _store(self, endpoint, result):
+        # Return True if the snapshot changed or failed
+        schedule = self._schedules.get(endpoint)
+        if isinstance(result, BaseException):
+            _LOGGER.debug("Can't refresh %s: %s", endpoint, result)
+            if endpoint in self._stale:
+                # Keep showing the restored snapshot
+                if schedule is not None:
+                    schedule.failed()
+                return False
+            changed = endpoint not in self._errors
+            self._snapshots.pop(endpoint, None)
+            # The listeners of every point are called when it's back
+            self._packed.pop(endpoint, None)
+            self._errors[endpoint] = result
+            if schedule is not None:
+                schedule.failed()
+            return changed
+
+        previous = self._snapshots.get(endpoint)
+        stale = endpoint in self._stale
+        changed = stale or (previous is not result and previous != result)
+        self._snapshots[endpoint] = result
+        self._errors.pop(endpoint, None)
+        self._stale.discard(endpoint)
+        if changed:
+            self._save(endpoint, result)
+        if changed and endpoint[0] in PACKED_MODULES:
+            self._changed[endpoint] = self._pack(endpoint, result, stale)
+        if changed and endpoint[0] in HISTORY_MODULES:
+            self._history.record(endpoint, result)
+        if schedule is not None:
+            schedule.record(changed)
+        if self._errors:
+            self._recover()
+        return changed
+
+    def _recover(self):
+        # The controller answers again: retry right away the endpoints that
+        # backed off because it was unreachable
+        for endpoint, error in list(self._errors.items()):
+            schedule = self._schedules.get(endpoint)
+            if schedule is not None and isinstance(error, _UNREACHABLE):
+                schedule.reset()
+
+    async def _async_load(self):
+        try:
+            data = await self._storage.async_load()
+        except Exception as e:
+            _LOGGER.warning("Can't load the snapshots saved for %s: %s", self._client.url, e)
+            return
+        for module, submodule, snapshot in (data or {}).get("snapshots", []):
+            endpoint = (module, submodule)
+            self._saved[endpoint] = snapshot
+            if endpoint not in self._snapshots and endpoint not in self._errors:
+                self._snapshots[endpoint] = snapshot
+                self._stale.add(endpoint)
+
+    def _save(self, endpoint, snapshot):
+        self._saved[endpoint] = snapshot
+        if self._storage is not None:
+            self._storage.async_delay_save(self._data_to_save, SAVE_DELAY)
+
+    def _data_to_save(self):
+        return {
+            "snapshots": [
+                [module, submodule, snapshot]
+                for (module, submodule), snapshot in self._saved.items()
+                if (module, submodule) in self._subscribers
+            ]
+        }
+
+    def _module_intervals(self, module):
+        return self._intervals.get(module, (DEFAULT_INTERVAL, DEFAULT_MAX_INTERVAL))
+
+    def _update_schedule(self, endpoint):
+        # The most demanding entity sets the limits of the endpoint
+        default_floor, default_ceiling = self._module_intervals(endpoint[0])
+        limits = self._limits[endpoint].values()
+        floor = min(default_floor if floor is None else floor for floor, _ in limits)
+        ceiling = min(default_ceiling if ceiling is None else ceiling for _, ceiling in limits)
+        schedule = self._schedules.get(endpoint)
+        if schedule is None:
+            self._schedules[endpoint] = Schedule(floor, ceiling)
+        else:
+            schedule.set_limits(floor, ceiling)
+
+    def _pack(self, endpoint, snapshot, stale=False):
+        # Return the attributes that changed, None if unknown
+        index = self._bit_indexes.setdefault(endpoint[0], BitIndex())
+        packed = index.pack(snapshot)
+        previous = self._packed.get(endpoint)
+        self._packed[endpoint] = packed
+        if previous is None or stale:
+            return None
+        return index.changes(previous, packed)
+
+    def _notify(self, endpoint):
+        changed = self._changed.pop(endpoint, None)
+        everything = self._listeners.get(None, {})
+        by_attribute = self._listeners.get(endpoint, {})
+        if changed is None:
+            groups = list(by_attribute.values())
+        else:
+            groups = [by_attribute.get(None, ())]
+            groups += [by_attribute[attribute] for attribute in changed if attribute in by_attribute]
+        for listeners in [everything.get(None, ())] + groups:
+            for listener in list(listeners):
+                listener(endpoint)
+
+    async def _async_poll(self):
+        while True:
+            # Set again by the subscriptions made while polling
+            self._wakeup.clear()
+            if self._streaming:
+                delay = DEFAULT_INTERVAL
+            else:
+                try:
+                    for endpoint in await self.async_refresh():
+                        self._notify(endpoint)
+                except Exception:
+                    _LOGGER.exception("Can't poll %s", self._client.url)
+                next_due = min(
+                    (schedule.next_due for schedule in list(self._schedules.values())),
+                    default=time.monotonic() + DEFAULT_INTERVAL,
+                )
+                delay = max(next_due - time.monotonic(), 0)
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+
+    def _wake(self):
+        # Recompute the next due endpoint, entities may subscribe from a thread
+        if self._wakeup is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def _async_stream(self):
+        delay = STREAM_RETRY_DELAY
+        while True:
+            try:
+                async for module, identifier, attributes in self._client.async_events():
+                    if not self._streaming:
+                        _LOGGER.info("Receive pushed changes from %s", self._client.url)
+                        self._streaming = True
+                        delay = STREAM_RETRY_DELAY
+                    self._apply(module, identifier, attributes)
+                _LOGGER.warning("Event stream of %s closed, fall back to polling", self._client.url)
+            except Exception as e:
+                _LOGGER.warning("Event stream of %s dropped, fall back to polling: %s", self._client.url, e)
+            self._streaming = False
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, MAX_STREAM_RETRY_DELAY)
+
+    def _apply(self, module, identifier, attributes):
+        endpoint = self.endpoint(module, identifier)
+        if endpoint not in self._subscribers:
+            return
+        recovered = endpoint in self._errors or endpoint in self._stale
+        # Snapshots may be shared with the client cache, never update in place
+        self._snapshots[endpoint] = {**self._snapshots.get(endpoint, {}), **attributes}
+        self._errors.pop(endpoint, None)
+        self._stale.discard(endpoint)
+        self._save(endpoint, self._snapshots[endpoint])
+        if module in PACKED_MODULES:
+            self._pack(endpoint, self._snapshots[endpoint])
+        if not recovered:
+            # Only the pushed attributes changed
+            self._changed[endpoint] = set(attributes)
+        if module in HISTORY_MODULES:
+            self._history.record(endpoint, attributes)
+        self._notify(endpoint)
+
+    async def _async_fetch_listing(self, module, endpoints):
+        try:
+            async with self._engine.slot(self._client.url):
+                index = await self._client.async_listing(MODULES[module].listing, cache=True)
+        except Exception as e:
+            if not _not_found(e):
+                raise
+            _LOGGER.info("%s can't list the %s modules, fetch them one by one", self._client.url, module)
+            self._unlisted.add(module)
+        else:
+            return [
+                index[name] if name in index else KeyError("%s %s not found" % (module.title(), name))
+                for _, name in endpoints
+            ]
+
+        return list(
+            await asyncio.gather(
+                *(self._async_fetch(endpoint) for endpoint in endpoints),
+                return_exceptions=True,
+            )
+        )
+
+    async def _async_fetch(self, endpoint):
+        fetch = self._fetchers.get(endpoint)
+        if fetch is None:
+            fetch = get_module(endpoint[0]).fetcher(self._client, endpoint[1])
+        async with self._engine.slot(self._client.url):
+            return await fetch()
+
+
+def _not_found(error):
+    if isinstance(error, aiohttp.ClientResponseError):
+        return error.status == 404
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        return error.response.status_code == 404
+    return False
@@ -0,0 +1,45 @@
+"""Decode the DFP API documents and read attributes from them."""
+import json
+from functools import lru_cache
+from operator import itemgetter
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def loads(content):
+    """Decode a JSON payload, with orjson when it is installed."""
+    if orjson is not None:
+        return orjson.loads(content)
+    return json.loads(content)
+
+
+@lru_cache(maxsize=256)
+def compile_accessor(path):
+    """
+    Return a function reading a dotted path from an attributes document.
+
+    "is_running" reads a top-level attribute, "pumps.0.speed" walks nested
+    objects and lists. The path is parsed once, the accessor only indexes.
+    """
+    if not path:
+        raise ValueError("Path must be a string")
+
+    parts = path.split(".")
+    if len(parts) == 1:
+        return itemgetter(path)
+
+    keys = [int(part) if part.isdigit() else part for part in parts]
+
+    def accessor(document):
+        for key in keys:
+            if isinstance(key, int) and isinstance(document, dict):
+                # Digits are a list index, or an object key
+                document = document[str(key)]
+            else:
+                document = document[key]
+        return document
+
+    return accessor
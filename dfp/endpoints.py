@@ -0,0 +1,87 @@
+"""Modules of the DFP API: where to read them, run their actions and who may use them."""
+
+SENSOR = "sensor"
+BINARY_SENSOR = "binary_sensor"
+SWITCH = "switch"
+
+
+class Module:
+    """
+    One module of the controller API.
+
+    path is the resource of the module. A keyed module is made of several
+    resources, path is formatted with the submodule naming one, and listing,
+    if set, returns them all in one request indexed by name. action, if set,
+    is formatted with an action name to run it. intervals are the default
+    (floor, ceiling) of its polling, in seconds. history keeps its changes
+    in memory. packed snapshots are mostly boolean IO points, compared as
+    bits to notify only the entities of the points that changed.
+    """
+
+    __slots__ = ("name", "path", "platforms", "keyed", "listing", "action", "intervals", "history", "packed")
+
+    def __init__(
+        self, name, path, platforms, keyed=False, listing=None, action=None, intervals=None, history=False, packed=False
+    ):
+        self.name = name
+        self.path = path
+        self.platforms = frozenset(platforms)
+        self.keyed = keyed
+        self.listing = listing
+        self.action = action
+        self.intervals = intervals
+        self.history = history
+        self.packed = packed
+
+    def key(self, submodule=None):
+        """Return the key of the endpoint serving a submodule."""
+        return (self.name, submodule if self.keyed else None)
+
+    def fetcher(self, client, submodule=None):
+        """Return a coroutine function fetching the snapshot of an endpoint with client."""
+        if not self.keyed:
+            path = self.path
+        elif submodule:
+            path = self.path % submodule
+        else:
+            async def missing():
+                raise ValueError("Submodule of %s must be set" % self.name)
+            return missing
+
+        async def fetch():
+            return await client.async_snapshot(path, cache=True)
+
+        return fetch
+
+
+MODULES = {
+    module.name: module
+    for module in (
+        Module("dfp", "/api/dfps", (SENSOR, BINARY_SENSOR, SWITCH), action="/api/dfps/action/%s"),
+        Module("dfpIO", "/api/dfps/io", (BINARY_SENSOR,), history=True, packed=True),
+        Module("tfp", "/api/tfps", (SENSOR, BINARY_SENSOR, SWITCH), action="/api/tfps/action/%s"),
+        Module("tfpIO", "/api/tfps/io", (BINARY_SENSOR,), history=True, packed=True),
+        Module("tank", "/api/tanks/%s", (SENSOR,), keyed=True, listing="/api/tanks", intervals=(5, 300)),
+    )
+}
+
+
+def get_module(name):
+    """Return the Module called name, raise KeyError if unknown."""
+    try:
+        return MODULES[name]
+    except KeyError:
+        raise KeyError("Module must be %s" % describe(MODULES)) from None
+
+
+def modules_for(platform):
+    """Return the names of the modules a platform can read, in order."""
+    return [name for name, module in MODULES.items() if platform in module.platforms]
+
+
+def describe(names):
+    """Return 'a, b or c' from names."""
+    names = list(names)
+    if len(names) < 2:
+        return "".join(names)
+    return "%s or %s" % (", ".join(names[:-1]), names[-1])
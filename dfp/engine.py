@@ -0,0 +1,86 @@
+"""Bound the fetches in flight across the DFP controllers and time their poll cycles."""
+import asyncio
+from contextlib import asynccontextmanager
+from threading import Lock
+from urllib.parse import urlsplit
+
+from .metrics import EndpointStats
+
+# Fetches in flight per controller host, and for all the controllers
+HOST_CONCURRENCY = 4
+GLOBAL_CONCURRENCY = 16
+
+_engine = None
+_lock = Lock()
+
+
+def get_engine():
+    """Return the engine shared by all the coordinators, create it on first use."""
+    global _engine
+    with _lock:
+        if _engine is None:
+            _engine = PollingEngine()
+        return _engine
+
+
+def remove_engine():
+    """Forget the engine and return it, the next one starts without statistics."""
+    global _engine
+    with _lock:
+        engine, _engine = _engine, None
+        return engine
+
+
+class PollingEngine:
+    """
+    Admission of the fetches of all the coordinators, and their cycle times.
+
+    Each coordinator polls its controller on its own task and schedule, so a
+    slow controller only delays its own endpoints. A fetch waits for one of
+    the host_limit slots of its host, then for one of the global_limit slots
+    shared by all the controllers. The duration of each poll cycle is kept
+    per controller.
+    """
+
+    def __init__(self, host_limit=HOST_CONCURRENCY, global_limit=GLOBAL_CONCURRENCY):
+        self._host_limit = host_limit
+        self._global = asyncio.Semaphore(global_limit)
+        self._hosts = {}
+        self._cycles = {}
+        self._last = {}
+
+    @asynccontextmanager
+    async def slot(self, url):
+        """Hold a slot of the host of url and a global one while fetching."""
+        host = urlsplit(url).netloc
+        semaphore = self._hosts.get(host)
+        if semaphore is None:
+            semaphore = self._hosts[host] = asyncio.Semaphore(self._host_limit)
+        async with semaphore, self._global:
+            yield
+
+    def record_cycle(self, url, duration):
+        """Account the duration of a poll cycle of a controller, in seconds."""
+        stats = self._cycles.get(url)
+        if stats is None:
+            stats = self._cycles[url] = EndpointStats()
+        stats.record(duration)
+        self._last[url] = duration
+
+    def cycles(self, url):
+        """Return a copy of the cycle statistics of a controller."""
+        stats = EndpointStats()
+        if url in self._cycles:
+            stats.merge(self._cycles[url])
+        return stats
+
+    def last_cycle(self, url):
+        """Return the duration of the last poll cycle of a controller, None if none."""
+        return self._last.get(url)
+
+    def as_dict(self):
+        """Return the cycle statistics of every controller as plain data."""
+        return {
+            url: dict(stats.as_dict(), last=self._last[url])
+            for url, stats in sorted(self._cycles.items())
+        }
@@ -0,0 +1,150 @@
+"""Base entity of the DFP platforms."""
+from datetime import timedelta
+import logging
+
+from homeassistant.core import callback
+from homeassistant.helpers.entity import Entity
+from homeassistant.helpers.event import async_track_time_interval
+
+_LOGGER = logging.getLogger(__name__)
+
+ATTR_SKIPPED_WRITES = "skipped_writes"
+ATTR_STALE = "stale"
+
+# Unchanged states are written at least this often, for liveness
+HEARTBEAT_INTERVAL = timedelta(minutes=5)
+
+# Raw value of an entity not read yet
+_UNSET = object()
+
+
+class DFPEntity(Entity):
+    """
+    Entity reading one attribute of a controller endpoint through its coordinator.
+
+    The state is written only when the raw value, then the rendered state or
+    the availability changed, and every HEARTBEAT_INTERVAL when nothing was
+    written meanwhile. The writes skipped are counted in the skipped_writes
+    attribute, not recorded. A value from the snapshot restored at startup
+    is shown with a stale attribute until the endpoint is fetched.
+    """
+
+    _client = None
+    _coordinator = None
+    _endpoint = None
+    _item = None
+    _accessor = None
+    _value = None
+    _available = False
+    _missing = False
+    _raw = _UNSET
+    _stale = False
+    _written = None
+    _wrote = False
+    _heartbeat = False
+    _skipped_writes = 0
+    _unrecorded_attributes = frozenset({ATTR_SKIPPED_WRITES})
+
+    @property
+    def should_poll(self):
+        """The coordinator polls the controller, or receives its changes."""
+        return False
+
+    @property
+    def force_update(self):
+        """Heartbeats write the state even if it didn't change."""
+        return self._heartbeat
+
+    @property
+    def extra_state_attributes(self):
+        """Return the number of state writes skipped, and if the value is stale."""
+        if self._stale:
+            return {ATTR_SKIPPED_WRITES: self._skipped_writes, ATTR_STALE: True}
+        return {ATTR_SKIPPED_WRITES: self._skipped_writes}
+
+    async def async_added_to_hass(self):
+        """Listen to the changes of the endpoint and start the coordinator."""
+        if self._endpoint is not None:
+            # Only the changes of the top-level attribute read are notified
+            self.async_on_remove(
+                self._coordinator.async_add_listener(
+                    self._handle_update, self._endpoint, self._item.split(".")[0]
+                )
+            )
+        self.async_on_remove(
+            async_track_time_interval(self.hass, self._async_heartbeat, HEARTBEAT_INTERVAL)
+        )
+        if self._endpoint is not None and self._coordinator.known(self._endpoint):
+            # The endpoint was restored or fetched before this entity was
+            # added, only its next changes would be notified
+            self._handle_update(self._endpoint)
+        self._coordinator.async_start(self.hass)
+
+    async def async_will_remove_from_hass(self):
+        """Stop fetching the endpoint for this entity."""
+        if self._endpoint is not None:
+            self._coordinator.unsubscribe(self, self._endpoint)
+
+    @callback
+    def _handle_update(self, endpoint):
+        if endpoint != self._endpoint:
+            return
+        try:
+            snapshot = self._coordinator.last(endpoint)
+        except Exception:
+            self._raw = _UNSET
+            self._available = False
+            self._async_write_changed()
+            return
+        try:
+            value = self._accessor(snapshot)
+        except (IndexError, KeyError, TypeError):
+            # The configured attribute isn't served by the endpoint
+            if not self._missing:
+                _LOGGER.error("No %s attribute in %s of %s", self._item, endpoint, self._client.url)
+                self._missing = True
+            self._raw = _UNSET
+            self._available = False
+            self._async_write_changed()
+            return
+        self._missing = False
+        stale = self._coordinator.stale(endpoint)
+        if self._available and value == self._raw and stale == self._stale:
+            # Another attribute of the endpoint changed
+            self._skipped_writes += 1
+            return
+        self._raw = value
+        self._stale = stale
+        self._set_value(value)
+        self._available = True
+        self._async_write_changed()
+
+    def _set_value(self, value):
+        self._value = value
+
+    def _forget_value(self):
+        # The next value is written even if it is the last one read
+        self._raw = _UNSET
+
+    @callback
+    def _async_write_changed(self):
+        """Write the state if it or the availability changed."""
+        written = (self.available, self.state, self._stale)
+        if written == self._written:
+            self._skipped_writes += 1
+            return
+        self._written = written
+        self._wrote = True
+        self.async_write_ha_state()
+
+    @callback
+    def _async_heartbeat(self, _now):
+        if self._wrote:
+            self._wrote = False
+            return
+        self._heartbeat = True
+        try:
+            self.async_write_ha_state()
+        finally:
+            self._heartbeat = False
+        self._written = (self.available, self.state, self._stale)
@@ -0,0 +1,144 @@
+"""Recent changes of the IO points of a DFP controller, kept in memory."""
+import time
+from array import array
+
+# Changes kept per attribute
+DEFAULT_HISTORY_SIZE = 256
+
+
+class RingBuffer:
+    """
+    Last size (timestamp, value) samples, oldest first.
+
+    Timestamps and values are kept in two fixed arrays of doubles, 16 bytes
+    per sample whatever the number of attributes. Timestamps must not go
+    backwards.
+    """
+
+    __slots__ = ("_times", "_values", "_size", "_start", "_count")
+
+    def __init__(self, size=DEFAULT_HISTORY_SIZE):
+        if size < 1:
+            raise ValueError("Size must be positive")
+        self._times = array("d", bytes(8 * size))
+        self._values = array("d", bytes(8 * size))
+        self._size = size
+        self._start = 0
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def append(self, timestamp, value):
+        index = (self._start + self._count) % self._size
+        self._times[index] = timestamp
+        self._values[index] = value
+        if self._count < self._size:
+            self._count += 1
+        else:
+            # Full, the oldest sample is overwritten
+            self._start = (self._start + 1) % self._size
+
+    def last(self):
+        """Return the newest (timestamp, value), None if empty."""
+        if not self._count:
+            return None
+        index = (self._start + self._count - 1) % self._size
+        return self._times[index], self._values[index]
+
+    def window(self, since, until=None):
+        """Return the (timestamp, value) samples from since to until included."""
+        return [
+            (self._times[index], self._values[index])
+            for index in self._indexes(self._first(since), until)
+        ]
+
+    def edges(self, since, until=None, rising=None):
+        """
+        Count the value changes from since to until.
+
+        rising=True counts only the changes from 0 to another value,
+        rising=False only the changes to 0.
+        """
+        first = self._first(since)
+        # The sample before the window tells if its first sample is a change
+        previous = self._values[(self._start + first - 1) % self._size] if first else None
+        count = 0
+        for index in self._indexes(first, until):
+            value = self._values[index]
+            if previous is not None and value != previous:
+                if rising is None or rising == (previous == 0):
+                    count += 1
+            previous = value
+        return count
+
+    def _first(self, since):
+        # Binary search of the first sample at or after since
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            if self._times[(self._start + middle) % self._size] < since:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def _indexes(self, first, until):
+        for offset in range(first, self._count):
+            index = (self._start + offset) % self._size
+            if until is not None and self._times[index] > until:
+                return
+            yield index
+
+
+class History:
+    """
+    Changes of the numeric and boolean attributes of some endpoints.
+
+    Only changes are recorded, so a buffer covers the last size changes of
+    an attribute however long it stayed stable. Queries take a window in
+    seconds back from now.
+    """
+
+    def __init__(self, size=DEFAULT_HISTORY_SIZE):
+        self._size = size
+        self._buffers = {}
+
+    def record(self, endpoint, attributes, timestamp=None):
+        """Record the attributes of an endpoint snapshot that changed."""
+        timestamp = time.time() if timestamp is None else timestamp
+        for attribute, value in attributes.items():
+            # Booleans are ints, strings and nested objects are not kept
+            if not isinstance(value, (int, float)):
+                continue
+            value = float(value)
+            key = (endpoint, attribute)
+            buffer = self._buffers.get(key)
+            if buffer is None:
+                buffer = self._buffers[key] = RingBuffer(self._size)
+            last = buffer.last()
+            if last is None or last[1] != value:
+                buffer.append(timestamp, value)
+
+    def buffer(self, endpoint, attribute):
+        """Return the RingBuffer of an attribute, None if never recorded."""
+        return self._buffers.get((endpoint, attribute))
+
+    def window(self, endpoint, attribute, seconds):
+        """Return the (timestamp, value) changes of the last seconds."""
+        buffer = self.buffer(endpoint, attribute)
+        if buffer is None:
+            return []
+        return buffer.window(time.time() - seconds)
+
+    def edges(self, endpoint, attribute, seconds, rising=None):
+        """Return how many times an attribute changed in the last seconds."""
+        buffer = self.buffer(endpoint, attribute)
+        if buffer is None:
+            return 0
+        return buffer.edges(time.time() - seconds, rising=rising)
+
+    def forget(self, endpoint):
+        """Drop the buffers of an endpoint."""
+        for key in [key for key in self._buffers if key[0] == endpoint]:
+            del self._buffers[key]
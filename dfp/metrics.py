@@ -0,0 +1,149 @@
+"""Request statistics of a DFP client."""
+import bisect
+import re
+from threading import Lock
+
+# Upper bounds of the latency histogram buckets, in seconds
+LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1, 2.5, 5, 7.5, 10, float("inf")
+)
+
+# Paths carrying a name are grouped under one endpoint
+_ENDPOINT_PATTERNS = (
+    (re.compile(r"^/api/tanks/[^/]+$"), "/api/tanks/{name}"),
+    (re.compile(r"^/api/(\w+)/action/[^/]+$"), r"/api/\1/action/{action}"),
+)
+
+
+def endpoint_name(path):
+    """Return the endpoint a request path is accounted under."""
+    for pattern, replacement in _ENDPOINT_PATTERNS:
+        if pattern.match(path):
+            return pattern.sub(replacement, path)
+    return path
+
+
+def error_class(error):
+    """Return a short label for an exception, with the status of HTTP errors."""
+    status = getattr(error, "status", None)
+    response = getattr(error, "response", None)
+    if status is None and response is not None:
+        status = getattr(response, "status_code", None)
+    if isinstance(status, int):
+        return "HTTP %d" % status
+    return type(error).__name__
+
+
+class EndpointStats:
+    """Counters and latency histogram of one endpoint."""
+
+    def __init__(self):
+        self.requests = 0
+        self.bytes = 0
+        self.latency_total = 0.0
+        self.errors = {}
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+
+    def record(self, latency, size=0, error=None):
+        self.requests += 1
+        self.bytes += size
+        self.latency_total += latency
+        self.buckets[bisect.bisect_left(LATENCY_BUCKETS, latency)] += 1
+        if error is not None:
+            label = error if isinstance(error, str) else error_class(error)
+            self.errors[label] = self.errors.get(label, 0) + 1
+
+    def merge(self, other):
+        self.requests += other.requests
+        self.bytes += other.bytes
+        self.latency_total += other.latency_total
+        for label, count in other.errors.items():
+            self.errors[label] = self.errors.get(label, 0) + count
+        for index, count in enumerate(other.buckets):
+            self.buckets[index] += count
+
+    def percentile(self, q):
+        """Return the estimated latency under which q percent of the requests are."""
+        if self.requests == 0:
+            return None
+
+        rank = self.requests * q / 100
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            if count and seen + count >= rank:
+                # Linear interpolation inside the bucket
+                lower = LATENCY_BUCKETS[index - 1] if index else 0.0
+                upper = LATENCY_BUCKETS[index]
+                if upper == float("inf"):
+                    return lower
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return LATENCY_BUCKETS[-2]
+
+    def as_dict(self):
+        return {
+            "requests": self.requests,
+            "errors": dict(self.errors),
+            "bytes": self.bytes,
+            "latency_mean": self.latency_total / self.requests if self.requests else None,
+            "latency_p50": self.percentile(50),
+            "latency_p95": self.percentile(95),
+            "latency_p99": self.percentile(99),
+        }
+
+
+class Metrics:
+    """
+    Thread-safe statistics of the requests sent by a client.
+
+    Latencies are in seconds, sizes in bytes of response body.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._endpoints = {}
+        self.token_refreshes = 0
+
+    def record(self, path, latency, size=0, error=None):
+        """Account one request, failed if error (exception or label) is set."""
+        name = endpoint_name(path)
+        with self._lock:
+            stats = self._endpoints.get(name)
+            if stats is None:
+                stats = self._endpoints[name] = EndpointStats()
+            stats.record(latency, size, error)
+
+    def token_refreshed(self):
+        with self._lock:
+            self.token_refreshes += 1
+
+    def endpoint(self, path):
+        """Return a copy of the statistics of an endpoint."""
+        stats = EndpointStats()
+        with self._lock:
+            if endpoint_name(path) in self._endpoints:
+                stats.merge(self._endpoints[endpoint_name(path)])
+        return stats
+
+    def total(self):
+        """Return the statistics of all the endpoints together."""
+        stats = EndpointStats()
+        with self._lock:
+            for endpoint in self._endpoints.values():
+                stats.merge(endpoint)
+        return stats
+
+    def as_dict(self):
+        """Return all the statistics as plain data."""
+        with self._lock:
+            return {
+                "token_refreshes": self.token_refreshes,
+                "endpoints": {
+                    name: stats.as_dict() for name, stats in sorted(self._endpoints.items())
+                },
+            }
+
+    def reset(self):
+        with self._lock:
+            self._endpoints = {}
+            self.token_refreshes = 0
@@ -0,0 +1,132 @@
+"""Keep one client per DFP controller."""
+import logging
+from threading import Lock
+
+import voluptuous as vol
+
+from homeassistant.const import CONF_RESOURCE, CONF_TIMEOUT, EVENT_HOMEASSISTANT_STOP
+import homeassistant.helpers.config_validation as cv
+
+from .client import Client, DEFAULT_KEEPALIVE, DEFAULT_POOL_SIZE
+from .commands import remove_command_queue
+from .coordinator import get_coordinator, remove_coordinator
+from .endpoints import MODULES
+from .engine import remove_engine
+from .transport import DEFAULT_RETRIES, DEFAULT_TIMEOUT, MIN_TIMEOUT, TransportPolicy
+
+_LOGGER = logging.getLogger(__name__)
+
+CONF_USERNAME = "username"
+CONF_PASSWORD = "password"
+CONF_POOL_SIZE = "pool_size"
+CONF_KEEPALIVE = "keepalive"
+CONF_STREAM = "stream"
+CONF_INTERVALS = "intervals"
+CONF_MIN_INTERVAL = "min_interval"
+CONF_MAX_INTERVAL = "max_interval"
+CONF_RETRIES = "retries"
+CONF_MIN_TIMEOUT = "min_timeout"
+
+DATA_SHUTDOWN = "dfp_shutdown"
+
+# Polling interval limits, of a module or of an entity
+INTERVAL_SCHEMA = {
+    vol.Optional(CONF_MIN_INTERVAL): cv.positive_time_period,
+    vol.Optional(CONF_MAX_INTERVAL): cv.positive_time_period,
+}
+
+# Options shared by every DFP platform to tune the client of a controller
+CLIENT_SCHEMA = {
+    vol.Optional(CONF_POOL_SIZE, default=DEFAULT_POOL_SIZE): cv.positive_int,
+    vol.Optional(CONF_KEEPALIVE, default=DEFAULT_KEEPALIVE): vol.All(
+        vol.Coerce(int), vol.Range(min=0)
+    ),
+    vol.Optional(CONF_STREAM, default=False): cv.boolean,
+    vol.Optional(CONF_RETRIES, default=DEFAULT_RETRIES): vol.All(
+        vol.Coerce(int), vol.Range(min=0, max=10)
+    ),
+    vol.Optional(CONF_TIMEOUT, default=DEFAULT_TIMEOUT): cv.positive_float,
+    vol.Optional(CONF_MIN_TIMEOUT, default=MIN_TIMEOUT): cv.positive_float,
+    vol.Optional(CONF_INTERVALS, default={}): vol.Schema(
+        {vol.In(list(MODULES)): vol.Schema(INTERVAL_SCHEMA)}
+    ),
+}
+
+_clients = {}
+_lock = Lock()
+
+
+def get_client(url, username, password, **kwargs):
+    """
+    Return the client of a controller, create it on first use.
+
+    Clients are keyed by (url, username), so platforms pointing to the same
+    controller share one connection pool while other controllers get their
+    own. The options of the first caller are used to create the client.
+    """
+    key = (url, username)
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            client = Client(url, username, password, **kwargs)
+            _clients[key] = client
+        return client
+
+
+def client_from_config(hass, config):
+    """Return the client of a platform configuration, from the event loop."""
+    register_shutdown(hass)
+    client = get_client(
+        config[CONF_RESOURCE],
+        config[CONF_USERNAME],
+        config[CONF_PASSWORD],
+        pool_size=config[CONF_POOL_SIZE],
+        keepalive=config[CONF_KEEPALIVE],
+        policy=TransportPolicy(
+            config[CONF_RETRIES], config[CONF_TIMEOUT], config[CONF_MIN_TIMEOUT]
+        ),
+    )
+    coordinator = get_coordinator(client)
+    if config[CONF_STREAM]:
+        coordinator.enable_stream()
+    for module, intervals in config[CONF_INTERVALS].items():
+        coordinator.set_intervals(module, *interval_limits(intervals))
+    return client
+
+
+def interval_limits(config):
+    """Return the (floor, ceiling) of an INTERVAL_SCHEMA config in seconds, None if unset."""
+    return tuple(
+        config[key].total_seconds() if key in config else None
+        for key in (CONF_MIN_INTERVAL, CONF_MAX_INTERVAL)
+    )
+
+
+def register_shutdown(hass):
+    """Close all the clients when Home Assistant stops."""
+    with _lock:
+        if hass.data.get(DATA_SHUTDOWN):
+            return
+        hass.data[DATA_SHUTDOWN] = True
+    hass.bus.async_listen_once(EVENT_HOMEASSISTANT_STOP, async_shutdown)
+
+
+async def async_shutdown(event=None):
+    """Close the connection pools of all the clients and forget them."""
+    with _lock:
+        clients = list(_clients.values())
+        _clients.clear()
+
+    for client in clients:
+        try:
+            coordinator = remove_coordinator(client)
+            if coordinator is not None:
+                await coordinator.async_stop()
+            commands = remove_command_queue(client)
+            if commands is not None:
+                await commands.async_stop()
+            await client.async_close()
+            client.close()
+        except Exception as e:
+            _LOGGER.warning("Can't close client of %s: %s", client.url, e)
+    remove_engine()
@@ -0,0 +1,61 @@
+"""Render the value templates of the DFP entities."""
+import logging
+from collections import OrderedDict
+
+from homeassistant.exceptions import TemplateError
+
+_LOGGER = logging.getLogger(__name__)
+
+# Rendered results kept per template, by raw value
+RENDER_CACHE_SIZE = 16
+
+
+def make_renderer(hass, value_template, cache_size=RENDER_CACHE_SIZE):
+    """
+    Create a renderer based on variable_template value.
+
+    The result is cached against the raw value, so the template is rendered
+    once per new value instead of on every state read. A render that reads
+    other entities or the time is never cached.
+    """
+    if value_template is None:
+        return lambda value: value
+
+    value_template.hass = hass
+    cache = OrderedDict()
+
+    def _render(value):
+        # The type is part of the key so 1, 1.0 and True don't collide
+        key = (type(value), value)
+        try:
+            if key in cache:
+                cache.move_to_end(key)
+                return cache[key]
+        except TypeError:
+            # Unhashable value, render it every time
+            key = None
+
+        info = value_template.async_render_to_info({"value": value}, parse_result=False)
+        try:
+            result = info.result()
+        except TemplateError:
+            _LOGGER.exception("Error parsing value")
+            return value
+
+        if key is not None and _depends_on_value_only(info):
+            cache[key] = result
+            if len(cache) > cache_size:
+                cache.popitem(last=False)
+        return result
+
+    return _render
+
+
+def _depends_on_value_only(info):
+    return not (
+        info.entities
+        or info.domains
+        or info.all_states
+        or info.all_states_lifecycle
+        or info.has_time
+    )
@@ -0,0 +1,62 @@
+"""Adaptive polling interval of the DFP endpoints."""
+import time
+
+# Factor stretching the interval after each poll without change
+STRETCH_FACTOR = 1.5
+# Factor stretching the interval after each failed poll
+FAILURE_FACTOR = 2
+# Longest interval while an endpoint fails, in seconds
+MAX_FAILURE_INTERVAL = 300
+
+
+class Schedule:
+    """
+    Polling interval of one endpoint, kept between a floor and a ceiling.
+
+    A change brings the interval back to the floor, each poll without change
+    stretches it towards the ceiling. Failures back off exponentially up to
+    MAX_FAILURE_INTERVAL (or the ceiling if higher), the first success polls
+    at the floor again. Intervals are in seconds.
+    """
+
+    def __init__(self, floor, ceiling):
+        self.floor = floor
+        self.ceiling = max(floor, ceiling)
+        self.interval = floor
+        self.failures = 0
+        # A new endpoint is due right away
+        self.next_due = 0.0
+
+    def set_limits(self, floor, ceiling):
+        """Change the floor and ceiling, keep the current interval inside."""
+        self.floor = floor
+        self.ceiling = max(floor, ceiling)
+        if not self.failures:
+            self.interval = min(max(self.interval, self.floor), self.ceiling)
+            self.next_due = min(self.next_due, time.monotonic() + self.interval)
+
+    def due(self, now=None):
+        return (time.monotonic() if now is None else now) >= self.next_due
+
+    def record(self, changed, now=None):
+        """Account a successful poll, changed if the snapshot differs."""
+        if changed or self.failures:
+            self.interval = self.floor
+        else:
+            self.interval = min(self.interval * STRETCH_FACTOR, self.ceiling)
+        self.failures = 0
+        self.next_due = (time.monotonic() if now is None else now) + self.interval
+
+    def failed(self, now=None):
+        """Account a failed poll."""
+        self.failures += 1
+        self.interval = min(
+            max(self.interval, self.floor) * FAILURE_FACTOR,
+            max(MAX_FAILURE_INTERVAL, self.ceiling),
+        )
+        self.next_due = (time.monotonic() if now is None else now) + self.interval
+
+    def reset(self):
+        """Poll right away, at the floor."""
+        self.interval = self.floor
+        self.next_due = 0.0
@@ -1,10 +1,8 @@
 import logging
-import requests
-from datetime import timedelta
 
 import voluptuous as vol
 
-from homeassistant.components.sensor import PLATFORM_SCHEMA
+from homeassistant.components.sensor import PLATFORM_SCHEMA, SensorEntity
 from homeassistant.const import (
     CONF_MONITORED_VARIABLES,
     CONF_NAME,
@@ -12,23 +10,26 @@ from homeassistant.const import (
     CONF_UNIT_OF_MEASUREMENT,
     CONF_VALUE_TEMPLATE,
 )
-from homeassistant.exceptions import TemplateError
 import homeassistant.helpers.config_validation as cv
-from homeassistant.helpers.entity import Entity
-from homeassistant.util import Throttle
+from homeassistant.helpers.entity import EntityCategory
 
-from .client import Client
+from .coordinator import get_coordinator
+from .decode import compile_accessor
+from .endpoints import MODULES, SENSOR, describe, modules_for
+from .engine import get_engine
+from .entity import DFPEntity
+from .registry import CLIENT_SCHEMA, INTERVAL_SCHEMA, client_from_config, interval_limits
+from .render import make_renderer
 
 _LOGGER = logging.getLogger(__name__)
 
-MIN_TIME_BETWEEN_UPDATES = timedelta(seconds=1)
-
 CONF_SENSORS = "sensors"
 CONF_USERNAME = "username"
 CONF_PASSWORD = "password"
 CONF_MODULE = "module"
 CONF_SUBMODULE = "submodule"
 CONF_STATE = "state"
+CONF_DIAGNOSTICS = "diagnostics"
 
 DEFAULT_NAME = "DFP sensor"
 
@@ -39,7 +40,8 @@ SENSOR_FUNCTION_SCHEMA = vol.Schema(
         vol.Optional(CONF_SUBMODULE): cv.string,
         vol.Required(CONF_STATE): cv.string,
         vol.Optional(CONF_UNIT_OF_MEASUREMENT): cv.string,
-        vol.Optional(CONF_VALUE_TEMPLATE): cv.template
+        vol.Optional(CONF_VALUE_TEMPLATE): cv.template,
+        **INTERVAL_SCHEMA,
     }
 )
 
@@ -52,97 +54,108 @@ PLATFORM_SCHEMA = PLATFORM_SCHEMA.extend(
         vol.Required(CONF_SENSORS): vol.Schema(
             {cv.string: SENSOR_FUNCTION_SCHEMA}
         ),
+        vol.Optional(CONF_DIAGNOSTICS, default=False): cv.boolean,
+        **CLIENT_SCHEMA,
     }
 )
 
 
-def setup_platform(hass, config, add_entities, discovery_info=None):
-    """Set up the DFP sensors."""
-
-    def make_renderer(value_template):
-        """Create a renderer based on variable_template value."""
-        if value_template is None:
-            return lambda value: value
-
-        value_template.hass = hass
-
-        def _render(value):
-            try:
-                return value_template.async_render({"value": value}, parse_result=False)
-            except TemplateError:
-                _LOGGER.exception("Error parsing value")
-                return value
-
-        return _render
-
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 1)
+
+
+# Diagnostic sensors on the client statistics: name, unit, state and
+# per-endpoint attributes
+DIAGNOSTICS = {
+    "requests": (
+        "Requests",
+        None,
+        lambda stats: stats.requests,
+        lambda stats: {"requests": stats.requests, "bytes": stats.bytes},
+    ),
+    "errors": (
+        "Request Errors",
+        None,
+        lambda stats: sum(stats.errors.values()),
+        lambda stats: stats.errors,
+    ),
+    "latency": (
+        "Request Latency P95",
+        "ms",
+        lambda stats: _ms(stats.percentile(95)),
+        lambda stats: {
+            "p50": _ms(stats.percentile(50)),
+            "p95": _ms(stats.percentile(95)),
+            "p99": _ms(stats.percentile(99)),
+        },
+    ),
+}
+
+
+async def async_setup_platform(hass, config, async_add_entities, discovery_info=None):
+    """Set up the DFP sensors, their state comes with the first poll."""
+
+    client = client_from_config(hass, config)
+    await get_coordinator(client).async_restore(hass)
     dev = []
 
     sensors = config[CONF_SENSORS]
     for sensorName, sensor in sensors.items():
-        renderer = make_renderer(sensor.get(CONF_VALUE_TEMPLATE))
-        try:
-            dfpSensor = DFPSensor(
+        renderer = make_renderer(hass, sensor.get(CONF_VALUE_TEMPLATE))
+        dev.append(
+            DFPSensor(
                 config[CONF_NAME],
                 sensor.get(CONF_NAME),
-                config[CONF_RESOURCE],
-                config[CONF_USERNAME],
-                config[CONF_PASSWORD],
+                client,
                 sensor.get(CONF_MODULE),
                 sensor.get(CONF_STATE),
                 sensor.get(CONF_SUBMODULE),
                 sensor.get(CONF_UNIT_OF_MEASUREMENT),
-                renderer
+                renderer,
+                *interval_limits(sensor)
             )
-        except requests.exceptions.MissingSchema:
-            _LOGGER.error(
-                "Missing resource or schema in configuration. Add http:// to your URL"
-            )
-            return False
-        except requests.exceptions.ConnectionError:
-            _LOGGER.error("No route to device at %s", config[CONF_RESOURCE])   
-
+        )
 
-        dev.append(dfpSensor)
+    if config[CONF_DIAGNOSTICS]:
+        for kind in DIAGNOSTICS:
+            dev.append(DFPDiagnosticSensor(config[CONF_NAME], client, kind))
+        dev.append(DFPCycleSensor(config[CONF_NAME], client))
 
-    add_entities(dev)
+    async_add_entities(dev)
 
 
 
-class DFPSensor(Entity):
+class DFPSensor(DFPEntity):
     """Representation of an DFP switch."""
 
-    def __init__(self, location,  name, url, username, password, module, state, submodule=None, unit_of_measurement=None, renderer=None):
+    def __init__(self, location,  name, client, module, state, submodule=None, unit_of_measurement=None, renderer=None, min_interval=None, max_interval=None):
         """Initialize the switch."""
         self._name = f"{location.title()} {name.title()}"
         self._module = module
         self._submodule = submodule
         self._item = state
-        self._url = url
+        self._url = client.url
         self._value = None
-        self._client = Client(url, username, password)
+        self._client = client
         self._unit_of_measurement = unit_of_measurement
         self._renderer = renderer
-        self._available = True
-
-
-        # Check if we can get status
-        try:
-            if self._module == "dfp":
-                self._value = self._client.dfpStatus(self._item)
-            elif self._module == "tfp":
-                self._value = self._client.tfpStatus(self._item)
-            elif self._module == "tank":
-                self._value = self._client.tankStatus(self._item, self._submodule)
-            else:
-                raise KeyError("Module must be dfp or tfp")
-        except requests.exceptions.ConnectionError:
-            _LOGGER.warning("No route to device %s", self._url)
-        except requests.HTTPError as e:
-            _LOGGER.error("Resource not found: %s", e)
-        except KeyError:
-            _LOGGER.error("No return_value received")
-        except ValueError:
-            _LOGGER.error("Response invalid")
+        self._available = False
+        self._coordinator = get_coordinator(self._client)
+        self._endpoint = None
+        self._accessor = compile_accessor(self._item)
+
+
+        # The attribute is checked against the first snapshot of the endpoint
+        modules = modules_for(SENSOR)
+        if self._module not in modules:
+            _LOGGER.error("Module of %s must be %s", self._name, describe(modules))
+            return
+        if MODULES[self._module].keyed and not self._submodule:
+            _LOGGER.error("Submodule of %s must be set for module %s", self._name, self._module)
+            return
+        self._endpoint = self._coordinator.subscribe(
+            self, self._module, self._submodule, min_interval, max_interval
+        )
 
     @property
     def name(self):
@@ -165,22 +178,50 @@ class DFPSensor(Entity):
         """Return the state of the sensor."""
         return self._renderer(self._value)
 
-    @Throttle(MIN_TIME_BETWEEN_UPDATES)
-    def update(self):
-        """Get the latest data from aREST API and update the state."""
-        try:
-            if self._module == "dfp":
-                self._value = self._client.dfpStatus(self._item)
-            elif self._module == "tfp":
-                self._value = self._client.tfpStatus(self._item)
-            elif self._module == "tank":
-                self._value = self._client.tankStatus(self._item, self._submodule)
-            
-            self._available = True
-        except requests.exceptions.ConnectionError:
-            _LOGGER.warning("No route to device %s", self._url)
-            self._available = False
-        except Exception as e:
-            _LOGGER.error("Error when update %s", e)
-            self._available = False
 
+class DFPDiagnosticSensor(SensorEntity):
+    """Statistics of the requests sent to a DFP controller."""
+
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+
+    def __init__(self, location, client, kind):
+        """Initialize the sensor."""
+        name, unit, self._state_of, self._attributes_of = DIAGNOSTICS[kind]
+        self._client = client
+        self._attr_name = f"{location.title()} {name}"
+        self._attr_native_unit_of_measurement = unit
+
+    async def async_update(self):
+        """Read the statistics of the client."""
+        metrics = self._client.metrics
+        self._attr_native_value = self._state_of(metrics.total())
+        attributes = {
+            endpoint: self._attributes_of(metrics.endpoint(endpoint))
+            for endpoint in metrics.as_dict()["endpoints"]
+        }
+        attributes["token_refreshes"] = metrics.token_refreshes
+        self._attr_extra_state_attributes = attributes
+
+
+class DFPCycleSensor(SensorEntity):
+    """Duration of the poll cycles of a DFP controller."""
+
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+    _attr_native_unit_of_measurement = "ms"
+
+    def __init__(self, location, client):
+        """Initialize the sensor."""
+        self._client = client
+        self._attr_name = f"{location.title()} Poll Cycle"
+
+    async def async_update(self):
+        """Read the cycle statistics of the polling engine."""
+        engine = get_engine()
+        stats = engine.cycles(self._client.url)
+        self._attr_native_value = _ms(engine.last_cycle(self._client.url))
+        self._attr_extra_state_attributes = {
+            "cycles": stats.requests,
+            "p50": _ms(stats.percentile(50)),
+            "p95": _ms(stats.percentile(95)),
+            "p99": _ms(stats.percentile(99)),
+        }
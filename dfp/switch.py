@@ -1,15 +1,26 @@
+import asyncio
 import logging
-import requests
 import voluptuous as vol
 
 from homeassistant.components.switch import PLATFORM_SCHEMA, SwitchEntity
 from homeassistant.const import CONF_NAME, CONF_RESOURCE
 import homeassistant.helpers.config_validation as cv
+from homeassistant.helpers.event import async_call_later
 
-from .client import Client
+from .commands import get_command_queue
+from .coordinator import get_coordinator
+from .decode import compile_accessor
+from .endpoints import SWITCH, describe, modules_for
+from .entity import DFPEntity
+from .registry import CLIENT_SCHEMA, INTERVAL_SCHEMA, client_from_config, interval_limits
 
 _LOGGER = logging.getLogger(__name__)
 
+# Seconds a service call waits for the controller to acknowledge an action
+ACTION_TIMEOUT = 15
+# Seconds after an acknowledged action before its outcome is read back
+CONFIRM_DELAY = 2
+
 CONF_ACTIONS = "actions"
 CONF_USERNAME = "username"
 CONF_PASSWORD = "password"
@@ -27,6 +38,7 @@ ACTION_FUNCTION_SCHEMA = vol.Schema(
         vol.Required(CONF_TURN_ON_ACTION): cv.string,
         vol.Required(CONF_TURN_OFF_ACTION): cv.string,
         vol.Required(CONF_STATE): cv.string,
+        **INTERVAL_SCHEMA,
     }
 )
 
@@ -39,77 +51,70 @@ PLATFORM_SCHEMA = PLATFORM_SCHEMA.extend(
         vol.Required(CONF_ACTIONS): vol.Schema(
             {cv.string: ACTION_FUNCTION_SCHEMA}
         ),
+        **CLIENT_SCHEMA,
     }
 )
 
 
-def setup_platform(hass, config, add_entities, discovery_info=None):
-    """Set up the DFP switches."""
+async def async_setup_platform(hass, config, async_add_entities, discovery_info=None):
+    """Set up the DFP switches, their state comes with the first poll."""
 
+    client = client_from_config(hass, config)
+    await get_coordinator(client).async_restore(hass)
     dev = []
 
     actions = config[CONF_ACTIONS]
     for actionName, action in actions.items():
-        try:
-            dfpSwitch = DFPSwitchAction(
+        dev.append(
+            DFPSwitchAction(
                 config[CONF_NAME],
                 action.get(CONF_NAME),
-                config[CONF_RESOURCE],
-                config[CONF_USERNAME],
-                config[CONF_PASSWORD],
+                client,
                 action.get(CONF_MODULE),
                 action.get(CONF_TURN_ON_ACTION),
                 action.get(CONF_TURN_OFF_ACTION),
-                action.get(CONF_STATE)
-            )
-        except requests.exceptions.MissingSchema:
-            _LOGGER.error(
-                "Missing resource or schema in configuration. Add http:// to your URL"
+                action.get(CONF_STATE),
+                *interval_limits(action)
             )
-            return False
-        except requests.exceptions.ConnectionError:
-            _LOGGER.error("No route to device at %s", config[CONF_RESOURCE])
-        
-        dev.append(dfpSwitch)
+        )
 
-    add_entities(dev)
+    async_add_entities(dev)
 
 
 
-class DFPSwitchAction(SwitchEntity):
+class DFPSwitchAction(DFPEntity, SwitchEntity):
     """Representation of an DFP switch."""
 
-    def __init__(self, location,  name, url, username, password, module, action_turn_on, action_turn_off, state):
+    def __init__(self, location,  name, client, module, action_turn_on, action_turn_off, state, min_interval=None, max_interval=None):
         """Initialize the switch."""
         self._name = f"{location.title()} {name.title()}"
         self._module = module
-        self._url = url
+        self._url = client.url
         self._action_turn_on = action_turn_on
         self._action_turn_off = action_turn_off
         self._item = state
         self._state = None
-        self._available = True
-        self._client = Client(url, username, password)
-
-
-        # Check if we can get status
+        # Without state to read, the switch doesn't wait for the first poll
+        self._available = self._item == "none"
+        self._client = client
+        self._coordinator = get_coordinator(self._client)
+        self._commands = get_command_queue(self._client)
+        self._endpoint = None
+        self._accessor = compile_accessor(self._item)
+        self._expected = None
+        self._cancel_confirm = None
+
+
+        # The attribute is checked against the first snapshot of the endpoint
         if self._item == "none":
             return
-        try:
-            if self._module == "dfp":
-                self._state = self._client.dfpStatus(self._item)
-            elif self._module == "tfp":
-                self._state = self._client.tfpStatus(self._item)
-            else:
-                raise KeyError("Module must be dfp or tfp")
-        except requests.exceptions.ConnectionError:
-            _LOGGER.warning("No route to device %s", self._url)
-        except requests.HTTPError as e:
-            _LOGGER.error("Resource not found: %s", e)
-        except KeyError:
-            _LOGGER.error("No return_value received")
-        except ValueError:
-            _LOGGER.error("Response invalid")
+        modules = modules_for(SWITCH)
+        if self._module not in modules:
+            _LOGGER.error("Module of %s must be %s", self._name, describe(modules))
+            return
+        self._endpoint = self._coordinator.subscribe(
+            self, self._module, None, min_interval, max_interval
+        )
 
     @property
     def name(self):
@@ -127,42 +132,69 @@ class DFPSwitchAction(SwitchEntity):
         return self._available
 
 
-    def turn_on(self, **kwargs):
+    def _set_value(self, value):
+        # Polls don't override the optimistic state before its confirmation
+        if self._expected is None:
+            self._state = value
+
+    async def async_will_remove_from_hass(self):
+        """Cancel the pending confirmation."""
+        self._cancel_confirmation()
+        await super().async_will_remove_from_hass()
+
+    async def async_turn_on(self, **kwargs):
         """Turn the device on."""
-        try:
-            if self._module == "dfp":
-                self._client.dfpAction(self._action_turn_on)
-            elif self._module == "tfp":
-                self._client.tfpAction(self._action_turn_on)
-        except Exception as e:
-            _LOGGER.error("Can't turn on function %s/%s at %s: %s", self._module, self._action_turn_off, self._resource, e)
+        await self._async_run_action(self._action_turn_on)
 
-    def turn_off(self, **kwargs):
+    async def async_turn_off(self, **kwargs):
         """Turn the device off."""
+        if self._action_turn_off == "none":
+            return
+        await self._async_run_action(self._action_turn_off)
+
+    async def _async_run_action(self, action):
+        # Actions of this switch supersede each other while still queued
+        future = self._commands.submit(
+            (self._module, self._action_turn_on, self._action_turn_off), self._module, action
+        )
         try:
-            if self._action_turn_off == "none":
-                return
-            if self._module == "dfp":
-                self._client.dfpAction(self._action_turn_off)
-            elif self._module == "tfp":
-                self._client.tfpAction(self._action_turn_off)
+            await asyncio.wait_for(asyncio.shield(future), ACTION_TIMEOUT)
+        except asyncio.TimeoutError:
+            _LOGGER.warning("No ack for function %s/%s at %s yet, it stays queued", self._module, action, self._url)
+            return
         except Exception as e:
-                _LOGGER.error("Can't turn off function %s/%s at %s: %s", self._module, self._action_turn_off, self._resource, e)
-
-    def update(self):
-        """Get the latest data from aREST API and update the state."""
-        if self._item == "none":
+            _LOGGER.error("Can't run function %s/%s at %s: %s", self._module, action, self._url, e)
+            return
+        if self._endpoint is None or self.hass is None:
             return
+
+        # Show the expected state now, read it back once the controller had
+        # time to apply the action
+        self._expected = action == self._action_turn_on
+        self._state = self._expected
+        self._forget_value()
+        self._async_write_changed()
+        self._cancel_confirmation()
+        self._cancel_confirm = async_call_later(self.hass, CONFIRM_DELAY, self._async_confirm)
+
+    async def _async_confirm(self, _now):
+        self._cancel_confirm = None
+        expected, self._expected = self._expected, None
         try:
-            if self._module == "dfp":
-                self._state = self._client.dfpStatus(self._item)
-            elif self._module == "tfp":
-                self._state = self._client.tfpStatus(self._item)
-            
-            self._available = True
-        except requests.exceptions.ConnectionError:
-            _LOGGER.warning("No route to device %s", self._url)
-            self._available = False
+            value = self._accessor(await self._coordinator.async_refresh_endpoint(self._endpoint))
         except Exception as e:
-            _LOGGER.error("Error when update %s", e)
-            self._available = False
+            _LOGGER.debug("Can't confirm state of %s: %s", self._name, e)
+            return
+        if bool(value) != expected:
+            _LOGGER.warning(
+                "%s is %s on %s after the action, roll back",
+                self._name, "on" if value else "off", self._url,
+            )
+        self._state = value
+        self._available = True
+        self._async_write_changed()
+
+    def _cancel_confirmation(self):
+        if self._cancel_confirm is not None:
+            self._cancel_confirm()
+            self._cancel_confirm = None
@@ -0,0 +1,60 @@
+"""Timeouts and retries of the requests sent to a DFP controller."""
+import random
+
+from .breaker import unreachable
+
+# Retries of a failed GET, 0 to disable
+DEFAULT_RETRIES = 2
+# Seconds of the timeouts until enough latencies are known, and their ceiling
+DEFAULT_TIMEOUT = 10
+# Floor of the adaptive timeouts, in seconds
+MIN_TIMEOUT = 1
+# Timeouts are this factor of the observed latency percentiles
+TIMEOUT_FACTOR = 4
+# Requests of an endpoint needed before its timeouts adapt
+MIN_SAMPLES = 20
+# Seconds of the first retry delay, doubled on each retry, and their ceiling
+BACKOFF = 0.5
+MAX_BACKOFF = 5
+
+# Statuses of an overloaded or restarting controller, worth retrying
+RETRY_STATUSES = (502, 503, 504)
+
+
+class TransportPolicy:
+    """
+    Decide the timeouts of a request and whether a failed one is retried.
+
+    The connect timeout follows the median latency of the endpoint, the read
+    timeout its 99th percentile, both times TIMEOUT_FACTOR and kept between
+    min_timeout and timeout. Only GETs are retried, on connection errors,
+    timeouts and RETRY_STATUSES, after an exponential delay with full jitter.
+    Actions are never replayed automatically.
+    """
+
+    def __init__(self, retries=DEFAULT_RETRIES, timeout=DEFAULT_TIMEOUT, min_timeout=MIN_TIMEOUT):
+        self.retries = retries
+        self.timeout = timeout
+        self.min_timeout = min(min_timeout, timeout)
+
+    def timeouts(self, stats):
+        """Return (connect, read) timeouts in seconds from EndpointStats."""
+        if stats.requests < MIN_SAMPLES:
+            return self.timeout, self.timeout
+        return self._bound(stats.percentile(50)), self._bound(stats.percentile(99))
+
+    def retry(self, method, attempt, error=None, status=None):
+        """Return True if the attempt (from 0) of a request must be retried."""
+        if method.lower() != "get" or attempt >= self.retries:
+            return False
+        if error is not None:
+            return unreachable(error)
+        return status in RETRY_STATUSES
+
+    @staticmethod
+    def delay(attempt):
+        """Return the seconds to wait before retrying an attempt."""
+        return random.uniform(0, min(MAX_BACKOFF, BACKOFF * 2 ** attempt))
+
+    def _bound(self, latency):
+        return min(max(latency * TIMEOUT_FACTOR, self.min_timeout), self.timeout)
@@ -0,0 +1,244 @@
+"""
+Benchmark the DFP entities against the local fake controller.
+
+For each entity count, adds DFPSensor, DFPBinarySensor and DFPSwitchAction
+entities on one fake controller to a Home Assistant instance, lets the
+coordinator poll it for a few cycles while an IO point toggles, and reports:
+
+- setup: seconds to build and add the entities;
+- req/cycle: requests received by the controller per poll cycle;
+- cycle p50/max: wall time of the poll cycles of the coordinator, in ms;
+- calls/cycle: entity listeners called per poll cycle;
+- cpu/call: process CPU time per listener call, in µs;
+- writes/cycle: states written per poll cycle;
+- action POSTs: requests sent for a burst of toggles on every switch.
+
+Run from the repository root, with Home Assistant installed:
+
+    python tools/bench_dfp.py --entities 10 100 1000 --latency 0.02
+"""
+import argparse
+import asyncio
+from datetime import timedelta
+import json
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from homeassistant.const import EVENT_STATE_CHANGED  # noqa: E402
+from homeassistant.core import HomeAssistant  # noqa: E402
+from homeassistant.helpers import device_registry, entity, entity_registry  # noqa: E402
+from homeassistant.helpers.entity_platform import EntityPlatform  # noqa: E402
+
+from dfp.binary_sensor import DFPBinarySensor  # noqa: E402
+from dfp.coordinator import DEFAULT_INTERVAL  # noqa: E402
+from dfp.engine import get_engine  # noqa: E402
+from dfp.registry import async_shutdown, get_client  # noqa: E402
+from dfp.render import make_renderer  # noqa: E402
+from dfp.sensor import DFPSensor  # noqa: E402
+from dfp.switch import DFPSwitchAction  # noqa: E402
+from fake_controller import DEFAULT_STATE, FakeController  # noqa: E402
+
+# Share of each entity type in a scenario
+SENSOR_SHARE = 0.5
+BINARY_SENSOR_SHARE = 0.3
+
+TOGGLES_PER_SWITCH = 3
+
+# IO point toggled by the controller on every cycle
+TOGGLED = ("dfpIO", "water_upper")
+
+
+def build_entities(hass, client, count):
+    """Return sensors, binary sensors and switches reading the fake state, by domain."""
+    sensors = [
+        (module, name, item)
+        for (module, name), attributes in DEFAULT_STATE.items()
+        if module in ("dfp", "tfp", "tank")
+        for item in attributes
+    ]
+    binary_sensors = [
+        (module, item)
+        for (module, _), attributes in DEFAULT_STATE.items()
+        if module in ("dfpIO", "tfpIO")
+        for item in attributes
+    ]
+
+    renderer = make_renderer(hass, None)
+    entities = {"sensor": [], "binary_sensor": [], "switch": []}
+    sensor_count = int(count * SENSOR_SHARE)
+    binary_sensor_count = int(count * BINARY_SENSOR_SHARE)
+    for index in range(sensor_count):
+        module, name, item = sensors[index % len(sensors)]
+        entities["sensor"].append(
+            DFPSensor("bench", "sensor %d" % index, client, module, item, name, renderer=renderer)
+        )
+    for index in range(binary_sensor_count):
+        module, item = binary_sensors[index % len(binary_sensors)]
+        entities["binary_sensor"].append(
+            DFPBinarySensor("bench", "binary %d" % index, client, module, item, renderer)
+        )
+    for index in range(count - sensor_count - binary_sensor_count):
+        module = ("dfp", "tfp")[index % 2]
+        entities["switch"].append(
+            DFPSwitchAction("bench", "switch %d" % index, client, module, "start", "stop", "is_running")
+        )
+    return entities
+
+
+def time_listener(entity, calls):
+    """Account the calls of the listener of an entity and their CPU time in calls."""
+    handle_update = entity._handle_update
+
+    def timed(endpoint):
+        start = time.process_time()
+        handle_update(endpoint)
+        calls.append(time.process_time() - start)
+
+    # Replaced before the entity is added, so the coordinator calls it
+    entity._handle_update = timed
+
+
+async def async_make_hass(config_dir):
+    """Return a Home Assistant instance able to add entities, not started."""
+    hass = HomeAssistant(config_dir)
+    entity.async_setup(hass)
+    await device_registry.async_load(hass)
+    await entity_registry.async_load(hass)
+    return hass
+
+
+async def run_scenario(count, cycles, latency, failure_rate):
+    controller = FakeController(latency=latency, failure_rate=failure_rate).start()
+    config_dir = tempfile.TemporaryDirectory()
+    hass = await async_make_hass(config_dir.name)
+    platforms = []
+    try:
+        client = get_client(controller.url, controller.username, controller.password)
+        engine = get_engine()
+        durations = []
+        polled = asyncio.Event()
+        record_cycle = engine.record_cycle
+
+        def timed_cycle(url, duration):
+            durations.append(duration)
+            record_cycle(url, duration)
+            polled.set()
+
+        engine.record_cycle = timed_cycle
+        calls = []
+        writes = []
+        hass.bus.async_listen(EVENT_STATE_CHANGED, writes.append)
+
+        start = time.perf_counter()
+        entities = build_entities(hass, client, count)
+        for domain, domain_entities in entities.items():
+            for domain_entity in domain_entities:
+                time_listener(domain_entity, calls)
+            platform = EntityPlatform(
+                hass=hass,
+                logger=logging.getLogger(__name__),
+                domain=domain,
+                platform_name="dfp",
+                platform=None,
+                scan_interval=timedelta(seconds=30),
+                entity_namespace=None,
+            )
+            platforms.append(platform)
+            await platform.async_add_entities(domain_entities)
+        setup = time.perf_counter() - start
+
+        # Let the first poll fetch every endpoint
+        await asyncio.sleep(DEFAULT_INTERVAL * 2)
+        controller.reset_hits()
+        del durations[:], calls[:], writes[:]
+        module, attribute = TOGGLED
+        for cycle in range(cycles):
+            # One change per poll cycle, the schedule stays at its floor
+            controller.update(module, {attribute: cycle % 2 == 1})
+            polled.clear()
+            await asyncio.wait_for(polled.wait(), DEFAULT_INTERVAL * 10)
+        requests = sum(controller.reset_hits().values())
+        polls = len(durations)
+        notified = len(calls)
+        written = len(writes)
+
+        switches = entities["switch"]
+        toggles = [
+            toggle()
+            for _ in range(TOGGLES_PER_SWITCH)
+            for switch in switches
+            for toggle in (switch.async_turn_on, switch.async_turn_off)
+        ]
+        await asyncio.gather(*toggles, return_exceptions=True)
+        posts = sum(hits for key, hits in controller.reset_hits().items() if key.startswith("POST /api/"))
+
+        return {
+            "entities": count,
+            "setup_s": round(setup, 3),
+            "cycles": polls,
+            "requests_per_cycle": round(requests / polls, 2),
+            "cycle_p50_ms": round(statistics.median(durations) * 1000, 2),
+            "cycle_max_ms": round(max(durations) * 1000, 2),
+            "calls_per_cycle": round(notified / polls, 2),
+            "cpu_per_call_us": round(sum(calls[:notified]) / notified * 1e6, 2) if notified else None,
+            "writes_per_cycle": round(written / polls, 2),
+            "toggles": len(toggles),
+            "action_posts": posts,
+            "errors": client.metrics.total().errors,
+        }
+    finally:
+        for platform in platforms:
+            await platform.async_reset()
+        await async_shutdown()
+        await hass.async_stop(force=True)
+        config_dir.cleanup()
+        controller.stop()
+
+
+def print_table(results):
+    columns = (
+        ("entities", "entities"),
+        ("setup_s", "setup s"),
+        ("requests_per_cycle", "req/cycle"),
+        ("cycle_p50_ms", "cycle p50 ms"),
+        ("cycle_max_ms", "cycle max ms"),
+        ("calls_per_cycle", "calls/cycle"),
+        ("cpu_per_call_us", "cpu/call µs"),
+        ("writes_per_cycle", "writes/cycle"),
+        ("toggles", "toggles"),
+        ("action_posts", "action POSTs"),
+    )
+    print(" | ".join(title for _, title in columns))
+    for result in results:
+        print(" | ".join(str(result[key]).rjust(len(title)) for key, title in columns))
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--entities", type=int, nargs="+", default=[10, 100, 500])
+    parser.add_argument("--cycles", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.01, help="seconds added to each request")
+    parser.add_argument("--failure-rate", type=float, default=0, help="share of requests answering 503")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.CRITICAL)
+    results = []
+    for count in args.entities:
+        results.append(await run_scenario(count, args.cycles, args.latency, args.failure_rate))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_table(results)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,316 @@
+"""
+Local stand-in for the DFP API.
+
+Serves /token-auth, /api/dfps, /api/dfps/io, /api/tfps, /api/tfps/io,
+/api/tanks, /api/tanks/<name>, /api/<dfps|tfps>/action/<action> and the /api/events
+stream, from an in-memory state. Run it and point a platform to it:
+
+    python tools/fake_controller.py --port 8080
+
+or start it from Python and change the state with FakeController.update().
+Every request can be delayed (latency) and fail with a 503 (failure_rate),
+and requests are counted by method and path in FakeController.hits.
+"""
+import argparse
+import base64
+import json
+import logging
+import queue
+import random
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_LOGGER = logging.getLogger(__name__)
+
+TOKEN_LIFETIME = 3600
+KEEPALIVE_INTERVAL = 15
+
+DEFAULT_STATE = {
+    ("dfp", None): {"is_running": True, "is_auto": True, "is_security": False, "is_wash": False},
+    ("dfpIO", None): {"water_upper": True, "water_under": False, "motor": False, "pump": False},
+    ("tfp", None): {"is_running": True, "is_auto": True, "is_uvc1_running": True},
+    ("tfpIO", None): {"pond_pump": True, "uvc1": True, "uvc2": False},
+    ("tank", "tank1"): {"level": 120, "volume": 800, "percent": 80, "is_disabled": False},
+    ("tank", "tank2"): {"level": 90, "volume": 600, "percent": 60, "is_disabled": False},
+}
+
+# Actions changing a boolean attribute of their module
+ACTIONS = {
+    "start": ("is_running", True),
+    "stop": ("is_running", False),
+    "auto": ("is_auto", True),
+    "manual": ("is_auto", False),
+    "wash": ("is_wash", True),
+}
+
+MODULES = {
+    "dfps": "dfp",
+    "dfps/io": "dfpIO",
+    "tfps": "tfp",
+    "tfps/io": "tfpIO",
+}
+
+
+def make_token(lifetime=TOKEN_LIFETIME):
+    """Return an unsigned JWT expiring in lifetime seconds."""
+
+    def encode(document):
+        return base64.urlsafe_b64encode(json.dumps(document).encode()).decode().rstrip("=")
+
+    header = encode({"alg": "none", "typ": "JWT"})
+    payload = encode({"sub": "dfp", "exp": int(time.time() + lifetime)})
+    return "%s.%s." % (header, payload)
+
+
+class FakeController:
+    """In-memory controller state with its HTTP server."""
+
+    def __init__(
+        self,
+        host="127.0.0.1",
+        port=0,
+        username="dfp",
+        password="dfp",
+        latency=0,
+        failure_rate=0,
+    ):
+        self.username = username
+        self.password = password
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.hits = Counter()
+        self._lock = threading.Lock()
+        self._state = {key: dict(value) for key, value in DEFAULT_STATE.items()}
+        self._versions = {key: 1 for key in self._state}
+        self._streams = []
+        self._server = ThreadingHTTPServer((host, port), _handler(self))
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return "http://%s:%s" % (host, port)
+
+    def start(self):
+        """Serve in a background thread."""
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop serving and close the event streams."""
+        with self._lock:
+            for stream in self._streams:
+                stream.put(None)
+        self._server.shutdown()
+        self._server.server_close()
+
+    def hit(self, method, path):
+        """Count a request, return False if it must fail."""
+        with self._lock:
+            self.hits["%s %s" % (method, path)] += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return random.random() >= self.failure_rate
+
+    def reset_hits(self):
+        """Clear the request counters and return the previous ones."""
+        with self._lock:
+            hits = self.hits
+            self.hits = Counter()
+            return hits
+
+    def document(self, module, name=None):
+        """Return (version, attributes) of a module, or None if unknown."""
+        with self._lock:
+            key = (module, name)
+            if key not in self._state:
+                return None
+            return self._versions[key], dict(self._state[key])
+
+    def tanks(self):
+        """Return (version, {name: attributes}) of all the tanks."""
+        with self._lock:
+            tanks = {
+                name: dict(attributes)
+                for (module, name), attributes in self._state.items()
+                if module == "tank"
+            }
+            version = sum(
+                version for (module, _), version in self._versions.items() if module == "tank"
+            )
+            return version, tanks
+
+    def update(self, module, attributes, name=None):
+        """Change attributes of a module and push them to the event streams."""
+        with self._lock:
+            key = (module, name)
+            self._state.setdefault(key, {}).update(attributes)
+            self._versions[key] = self._versions.get(key, 0) + 1
+            for stream in self._streams:
+                stream.put((module, name, dict(attributes)))
+
+    def action(self, module, action):
+        """Run an action, return False if unknown."""
+        if action not in ACTIONS:
+            return False
+        attribute, value = ACTIONS[action]
+        self.update(module, {attribute: value})
+        return True
+
+    def subscribe(self):
+        """Return a queue receiving the full state, then every change."""
+        stream = queue.Queue()
+        with self._lock:
+            for (module, name), attributes in self._state.items():
+                stream.put((module, name, dict(attributes)))
+            self._streams.append(stream)
+        return stream
+
+    def unsubscribe(self, stream):
+        with self._lock:
+            if stream in self._streams:
+                self._streams.remove(stream)
+
+
+def _handler(controller):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            _LOGGER.debug(format, *args)
+
+        def do_POST(self):
+            path = self.path.rstrip("/")
+            body = self._body()
+            if not controller.hit("POST", path):
+                return self._json(503, {"error": "injected failure"})
+            if path == "/token-auth":
+                credentials = json.loads(body or b"{}")
+                if (
+                    credentials.get("username") != controller.username
+                    or credentials.get("password") != controller.password
+                ):
+                    return self._json(400, {"error": "bad credentials"})
+                return self._json(200, {"token": make_token()})
+
+            if not self._authorized():
+                return self._json(401, {"error": "unauthorized"})
+            for prefix, module in (("/api/dfps/action/", "dfp"), ("/api/tfps/action/", "tfp")):
+                if path.startswith(prefix):
+                    if controller.action(module, path[len(prefix):]):
+                        return self._json(200, {"message": "ok"})
+                    return self._json(404, {"error": "unknown action"})
+            self._json(404, {"error": "not found"})
+
+        def do_GET(self):
+            path = self.path.rstrip("/")
+            if not controller.hit("GET", path):
+                return self._json(503, {"error": "injected failure"})
+            if not self._authorized():
+                return self._json(401, {"error": "unauthorized"})
+            if path == "/api/events":
+                return self._events()
+
+            if path == "/api/tanks":
+                version, tanks = controller.tanks()
+                data = [
+                    {"id": name, "type": "tank", "attributes": attributes}
+                    for name, attributes in tanks.items()
+                ]
+                return self._document('"tanks-%s"' % version, data)
+
+            if path.startswith("/api/tanks/"):
+                module, name = "tank", path[len("/api/tanks/"):]
+            else:
+                module, name = MODULES.get(path[len("/api/"):]), None
+            document = controller.document(module, name) if module else None
+            if document is None:
+                return self._json(404, {"error": "not found"})
+
+            version, attributes = document
+            self._document(
+                '"%s-%s-%s"' % (module, name, version),
+                {"id": name or module, "type": module, "attributes": attributes},
+            )
+
+        def _document(self, etag, data):
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self._json(200, {"data": data}, {"ETag": etag})
+
+        def _events(self):
+            stream = controller.subscribe()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Cache-Control", "no-cache")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            self.close_connection = True
+            try:
+                while True:
+                    try:
+                        change = stream.get(timeout=KEEPALIVE_INTERVAL)
+                    except queue.Empty:
+                        self.wfile.write(b": keep-alive\n\n")
+                        self.wfile.flush()
+                        continue
+                    if change is None:
+                        return
+                    module, name, attributes = change
+                    data = json.dumps({"data": {"id": name, "attributes": attributes}})
+                    self.wfile.write(("event: %s\ndata: %s\n\n" % (module, data)).encode())
+                    self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+            finally:
+                controller.unsubscribe(stream)
+
+        def _authorized(self):
+            return self.headers.get("Authorization", "").startswith("Bearer ")
+
+        def _body(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            return self.rfile.read(length) if length else b""
+
+        def _json(self, status, document, headers=None):
+            body = json.dumps(document).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency", type=float, default=0, help="seconds added to each request")
+    parser.add_argument("--failure-rate", type=float, default=0, help="share of requests answering 503")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    controller = FakeController(
+        args.host, args.port, latency=args.latency, failure_rate=args.failure_rate
+    ).start()
+    _LOGGER.info("Fake DFP controller listening on %s", controller.url)
+    try:
+        controller._thread.join()
+    except KeyboardInterrupt:
+        controller.stop()
+
+
+if __name__ == "__main__":
+    main()